@@ -0,0 +1,50 @@
+"""
+bench_embedder.py
+
+Times Embedder on the CPU against the number of worker processes, without the embedding cache,
+and checks that every worker count gives the same vectors, in the same order, as one process.
+
+The texts are the descriptions of the first --docs items of the curated training split.
+
+    python benchmarks/bench_embedder.py [--docs 20000] [--workers 1 2 4 8] [--store amazon_items_train.arrow]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from price_intel.cores import default_workers
+from price_intel.data.item_store import ItemStore
+from price_intel.vectorstore.embedder import WORKER_BATCH_SIZE, Embedder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--store", default="amazon_items_train.arrow")
+    args = parser.parse_args()
+
+    items = ItemStore(args.store).items(columns=["description"])
+    texts = [item.description for item in items[: args.docs]]
+    print(f"Embedding {len(texts):,} descriptions on {default_workers()} cores")
+
+    baseline = None
+    for workers in args.workers:
+        embedder = Embedder(device="cpu", workers=workers)
+        embedder.encode(texts[: workers * WORKER_BATCH_SIZE])  # Load the model in every worker
+        start = time.perf_counter()
+        vectors = embedder.encode(texts)
+        seconds = time.perf_counter() - start
+        embedder.close()
+        if baseline is None:
+            baseline = (seconds, vectors)
+        drift = float(np.abs(vectors - baseline[1]).max())
+        print(
+            f"workers {workers:>3}  threads/worker {embedder.threads_per_worker:>3}  "
+            f"{len(texts) / seconds:8,.0f} texts/sec   speedup {baseline[0] / seconds:5.2f}x   max drift {drift:.1e}"
+        )
+
+if __name__ == "__main__":
+    main()
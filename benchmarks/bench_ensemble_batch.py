@@ -0,0 +1,75 @@
+"""
+bench_ensemble_batch.py
+
+Times pricing a slice of the test split one description at a time, as PlanningAgent and
+train_ensemble used to, against each agent's price_batch, and reports the largest difference
+between the two sets of estimates.
+
+The specialist, frontier and ensemble agents make remote Modal and chat calls for every item,
+so only the local random forest agent runs by default. The descriptions are embedded once up
+front, so both runs read their embeddings from the cache and neither pays for the model alone.
+
+    python benchmarks/bench_ensemble_batch.py [--items 50] [--agents random_forest frontier specialist ensemble]
+"""
+
+import argparse
+import time
+
+import chromadb
+import numpy as np
+
+from price_intel.data.item_store import ItemStore
+from price_intel.vectorstore.embedder import shared_embedder
+
+AGENTS = ["random_forest", "frontier", "specialist", "ensemble"]
+
+
+def make_agent(name, collection):
+    if name == "random_forest":
+        from price_intel.agents.random_forest_agent import RandomForestAgent
+        return RandomForestAgent()
+    if name == "frontier":
+        from price_intel.agents.frontier_agent import FrontierAgent
+        return FrontierAgent(collection)
+    if name == "specialist":
+        from price_intel.agents.specialist_agent import SpecialistAgent
+        return SpecialistAgent()
+    from price_intel.agents.ensemble_agent import EnsembleAgent
+    return EnsembleAgent(collection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--agents", nargs="+", default=["random_forest"], choices=AGENTS)
+    parser.add_argument("--db", default="products_vectorstore")
+    parser.add_argument("--store", default="amazon_items_test.arrow")
+    args = parser.parse_args()
+
+    items = ItemStore(args.store).items(columns=["description"])[: args.items]
+    descriptions = [item.description for item in items]
+    collection = chromadb.PersistentClient(path=args.db).get_or_create_collection("products")
+    shared_embedder().encode(descriptions)
+
+    for name in args.agents:
+        agent = make_agent(name, collection)
+        agent.price_batch(descriptions[:2])  # Warm up the models and connections
+
+        start = time.perf_counter()
+        looped = [agent.price(description) for description in descriptions]
+        loop_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = agent.price_batch(descriptions)
+        batch_seconds = time.perf_counter() - start
+
+        drift = float(np.max(np.abs(np.array(looped) - np.array(batched))))
+        print(
+            f"{name:<14} loop {len(descriptions) / loop_seconds:8.1f} items/sec   "
+            f"batch {len(descriptions) / batch_seconds:8.1f} items/sec   "
+            f"speedup {loop_seconds / batch_seconds:5.2f}x   max difference ${drift:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
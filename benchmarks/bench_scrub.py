@@ -0,0 +1,111 @@
+"""
+bench_scrub.py
+
+Checks that Item.scrub_details and Item.scrub give byte-identical output to the original
+implementation on a generated golden corpus, then times scrub against the original.
+
+The golden corpus is adversarial: non-ASCII digits and whitespace, and splices of the removal
+strings into each other. The timing corpus is shaped like the Amazon metadata instead, mostly
+ASCII with the occasional non-ASCII document.
+
+    python benchmarks/bench_scrub.py [--docs 20000] [--seed 42]
+"""
+
+import argparse
+import random
+import re
+import time
+
+from price_intel.data.items import Item
+
+WORDS = [
+    "steel", "Compatible", "with", "2019-2023", "Model", "XJ4500B12", "Pack", "of", "4", "inches",
+    "12V", "LED", "Waterproof", "B07XYZ1234", "Black,", ",", "Premium", "Quality", "[Upgraded]",
+    "{Kit}", "\"Quoted\"", "a,,b", "c,,,d", "mounting", "bracket", "for", "the", "and", "3-inch",
+]
+NON_ASCII_WORDS = ["①②③④⑤⑥⑦", "Ａ１２３４５６７", "١٢٣٤٥٦٧", "x²y²z²w²", "【NEW】", "café", " ", " "]
+FRAGMENTS = Item.REMOVALS + ["Num", "ber", "It", "em", "Batteries", "Included?", "\"", ":", " ", "\n", "\t", "\x1c"]
+SEPARATORS = [" ", " ", " ", "\n", "  ", ", ", ""]
+DETAIL_KEYS = [
+    "Item Weight", "Product Dimensions", "Date First Available", "Manufacturer", "Item model number",
+    "Best Sellers Rank", "Package Dimensions", "Batteries Required?", "Batteries Included?", "Number of Items",
+]
+DETAIL_VALUES = ["No", "Yes", "1.2 pounds", "ACME", "March 3, 2021", "XJ4500B12", "{\"Automotive\": 1234}"]
+
+
+def legacy_scrub_details(details):
+    for remove in Item.REMOVALS:
+        details = details.replace(remove, "")
+    return details
+
+
+def legacy_scrub(stuff):
+    stuff = re.sub(r'[:\[\]"{}【】\s]+', ' ', stuff).strip()
+    stuff = stuff.replace(" ,", ",").replace(",,,", ",").replace(",,", ",")
+    words = stuff.split(' ')
+    select = [word for word in words if len(word) < 7 or not any(char.isdigit() for char in word)]
+    return " ".join(select)
+
+
+def make_details(rng, adversarial):
+    """A details blob shaped like the Amazon metadata, spliced with removal fragments if adversarial"""
+    keys = rng.sample(DETAIL_KEYS, rng.randint(2, len(DETAIL_KEYS)))
+    text = "{" + ", ".join(f"\"{key}\": \"{rng.choice(DETAIL_VALUES)}\"" for key in keys) + "}"
+    if adversarial and rng.random() < 0.3:
+        spliced = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 12)))
+        cut = rng.randint(0, len(text))
+        text = text[:cut] + spliced + text[cut:]
+    return text
+
+
+def make_text(rng, adversarial):
+    if adversarial:
+        vocabulary = WORDS + FRAGMENTS + NON_ASCII_WORDS
+    else:
+        vocabulary = WORDS + (NON_ASCII_WORDS if rng.random() < 0.02 else [])
+    words = [rng.choice(vocabulary) for _ in range(rng.randint(0, 200))]
+    return "".join(word + rng.choice(SEPARATORS) for word in words)
+
+
+def make_corpus(size, seed, adversarial):
+    """Texts as scrub sees them: product contents, and details blobs after scrub_details"""
+    rng = random.Random(seed)
+    details = [make_details(rng, adversarial) for _ in range(size)]
+    texts = [make_text(rng, adversarial) for _ in range(size)]
+    return details, texts + [legacy_scrub_details(blob) for blob in details]
+
+
+def time_it(function, inputs):
+    start = time.perf_counter()
+    for value in inputs:
+        function(value)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    item = Item.__new__(Item)
+    for adversarial in (True, False):
+        details, texts = make_corpus(args.docs, args.seed, adversarial)
+        for value in details:
+            assert item.scrub_details(value) == legacy_scrub_details(value), repr(value)
+        for value in texts:
+            assert item.scrub(value) == legacy_scrub(value), repr(value)
+        corpus = "golden" if adversarial else "timing"
+        print(f"✓ Identical output on the {corpus} corpus: {len(details):,} details blobs, {len(texts):,} texts")
+
+    legacy_seconds = time_it(legacy_scrub, texts)
+    compiled_seconds = time_it(item.scrub, texts)
+    print(
+        f"scrub  legacy {legacy_seconds * 1e6 / len(texts):6.1f} µs/doc   "
+        f"compiled {compiled_seconds * 1e6 / len(texts):6.1f} µs/doc   "
+        f"speedup {legacy_seconds / compiled_seconds:4.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
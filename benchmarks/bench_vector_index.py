@@ -0,0 +1,110 @@
+"""
+bench_vector_index.py
+
+Compares find_similars lookups on the Chroma collection against the in-process MatrixIndex,
+exact and IVF, at full precision and at each compact precision the index was built with:
+per-query latency, peak RSS of a process that opens the index and serves the queries, and
+recall@k of each backend against exact full-precision search.
+
+Each backend also runs with the query item's category as a hint, as "<backend>+hint", whose
+recall is against exact search within that category. The index may be sharded by category
+(build_index --shards), in which case a hint only searches that category's shard.
+
+Queries are the descriptions of items from the test split, embedded once up front. Each backend
+runs in its own spawned process, so its memory is measured without the others or the embedding
+model: a forked process's peak RSS would include the pages it shares with this one.
+
+    python benchmarks/bench_vector_index.py [--queries 500] [--k 5] [--index products_index]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chromadb
+import numpy as np
+
+from price_intel.data.profiling import peak_rss_mb
+from price_intel.vectorstore.vector_index import ChromaIndex, open_index
+
+
+def index_meta(path):
+    """The meta of an index, or of the first shard of a sharded index"""
+    shards = os.path.join(path, "shards.json")
+    if os.path.exists(shards):
+        with open(shards) as f:
+            path = os.path.join(path, json.load(f)["categories"][0])
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+
+def open_backend(name, args):
+    name = name.removesuffix("+hint")
+    if name == "chroma":
+        return ChromaIndex(chromadb.PersistentClient(path=args.db).get_collection(args.collection))
+    search, _, precision = name.partition("-")
+    return open_index(args.index, nprobe=args.nprobe, exact=search == "exact", precision=precision or "float32", rerank=args.rerank)
+
+
+def run_backend(name, args, queries, categories):
+    """Worker entry point: open one backend, look up each query alone, and return documents, latencies and peak RSS"""
+    index = open_backend(name, args)
+    index.search(queries[:1], args.k)  # Warm up
+    latencies, documents = [], []
+    for query, category in zip(queries, categories):
+        hint = [category] if name.endswith("+hint") else None
+        start = time.perf_counter()
+        found, _ = index.search(query[None, :], args.k, categories=hint)[0]
+        latencies.append(time.perf_counter() - start)
+        documents.append(found)
+    return documents, np.array(latencies), peak_rss_mb()
+
+
+def recall(found, truth):
+    """The share of the true neighbours found, matching neighbours by document, as many products share a price"""
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / sum(len(set(t)) for t in truth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--db", default="products_vectorstore")
+    parser.add_argument("--collection", default="products")
+    parser.add_argument("--index", default="products_index")
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--rerank", type=int, default=50)
+    parser.add_argument("--store", default="amazon_items_test.arrow")
+    args = parser.parse_args()
+
+    # Imported here, so the spawned backend processes, which import this module, don't load them
+    from price_intel.data.item_store import ItemStore
+    from price_intel.vectorstore.embedder import Embedder
+
+    items = ItemStore(args.store).items(columns=["description", "category"])[: args.queries]
+    queries = Embedder().encode([item.description for item in items])
+    categories = [item.category for item in items]
+
+    quantized = index_meta(args.index).get("quantized", [])
+    backends = ["chroma", "exact", "ivf"] + [f"{search}-{precision}" for precision in quantized for search in ("exact", "ivf")]
+    backends += [f"{name}+hint" for name in backends]
+
+    results = {}
+    for name in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results[name] = pool.submit(run_backend, name, args, queries, categories).result()
+
+    for name, (documents, latencies, rss) in results.items():
+        truth = results["exact+hint" if name.endswith("+hint") else "exact"][0]
+        print(
+            f"{name:<18} p50 {np.percentile(latencies, 50) * 1e3:7.2f} ms   p95 {np.percentile(latencies, 95) * 1e3:7.2f} ms   "
+            f"peak RSS {rss:7,.0f} MB   recall@{args.k} {recall(documents, truth):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
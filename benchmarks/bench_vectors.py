@@ -0,0 +1,73 @@
+"""
+bench_vectors.py
+
+Measures the time and peak allocations of moving embeddings around as float32 arrays, against
+the float64 Python lists they used to travel as:
+
+- ingest: turning a batch of encoder output into what collection.add is given
+- load: reading every embedding of the vectorstore back into a training matrix
+
+Peak allocations are measured with tracemalloc, which sees NumPy buffers and Python objects.
+
+    python benchmarks/bench_vectors.py [--db products_vectorstore] [--collection products]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import chromadb
+import numpy as np
+
+from price_intel.train.train_random_forest import load_chroma_vectors
+
+
+def legacy_ingest(vectors):
+    return np.asarray(vectors, dtype=float).tolist()
+
+
+def float32_ingest(vectors):
+    return np.stack(list(vectors))
+
+
+def legacy_load(db_path, collection_name):
+    collection = chromadb.PersistentClient(path=db_path).get_collection(collection_name)
+    result = collection.get(include=["embeddings", "metadatas"])
+    embeddings = np.array(result["embeddings"], dtype=float)
+    prices = np.array([m["price"] for m in result["metadatas"]], dtype=float)
+    return embeddings, prices
+
+
+def measure(function, *args):
+    """Return the seconds taken and the peak MB allocated by a call"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 1024**2
+
+
+def report(name, legacy, current):
+    print(
+        f"{name:<7} legacy {legacy[0]:7.2f}s {legacy[1]:9,.0f} MB   "
+        f"float32 {current[0]:7.2f}s {current[1]:9,.0f} MB   "
+        f"saved {legacy[0] - current[0]:7.2f}s {legacy[1] - current[1]:9,.0f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="products_vectorstore")
+    parser.add_argument("--collection", default="products")
+    args = parser.parse_args()
+
+    embeddings, _ = load_chroma_vectors(args.db, args.collection)
+    report("ingest", measure(legacy_ingest, embeddings), measure(float32_ingest, embeddings))
+    del embeddings
+    report("load", measure(legacy_load, args.db, args.collection), measure(load_chroma_vectors, args.db, args.collection))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,25 +7,47 @@ Combines:
 - RandomForestAgent (embedding + RF)
 
 using a LinearRegression model trained offline and saved as `ensemble_model.pkl`.
+
+The frontier and random forest agents embed with the same shared model, so each description
+is embedded once and its vector handed to both. The three sub-agents then price it concurrently,
+each on a thread of the ensemble's pool, so a deal takes about as long as the slowest of them.
+
+price_batch does the same for many descriptions, with each sub-agent pricing the whole batch in
+its batch form, and the linear model applied to all of them as one NumPy matrix product.
+
+A sub-agent that fails or runs out of time fails the estimate, unless the agent is built with
+degraded_ok, in which case the others' average stands in for it and the estimate is marked degraded.
 """
 import os
-import pandas as pd
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
 import joblib
 
 from price_intel.agents.agent import Agent
 from price_intel.agents.specialist_agent import SpecialistAgent
 from price_intel.agents.frontier_agent import FrontierAgent
 from price_intel.agents.random_forest_agent import RandomForestAgent
+from price_intel.vectorstore.vector_index import VectorIndex
 
 class EnsembleAgent(Agent):
 
     name = "Ensemble Agent"
     color = Agent.YELLOW
+
+    SUB_AGENT_TIMEOUT = 60.0  # Seconds to wait for the sub-agents of one deal
+    FEATURES = ["Specialist", "Frontier", "RandomForest", "Min", "Max"]
+    POOL_SIZE = 8  # Threads, leaving room for sub-agent calls still running after a timeout
     
     def __init__(
         self,
         collection,
         model_path: str = "models/ensemble_model.pkl",
+        index: Optional[VectorIndex] = None,
+        timeout: float = SUB_AGENT_TIMEOUT,
+        degraded_ok: bool = False,
     ):
         """
         Initialize the EnsembleAgent by constructing all sub-agents and
@@ -33,6 +55,10 @@ class EnsembleAgent(Agent):
 
         :param collection: Chroma collection to use for FrontierAgent
         :param model_path: path to the trained ensemble model
+        :param index: the index FrontierAgent looks up similar products in, defaulting to the collection
+        :param timeout: seconds to wait for the sub-agents of one deal
+        :param degraded_ok: whether to stand in for a failed or timed-out sub-agent with the average
+            of the others, instead of raising its error
         """
         self.log("Initializing Ensemble Agent")
 
@@ -43,16 +69,70 @@ class EnsembleAgent(Agent):
             )
 
         self.specialist = SpecialistAgent()
-        self.frontier = FrontierAgent(collection)
+        self.frontier = FrontierAgent(collection, index)
         self.random_forest = RandomForestAgent()
         self.model = joblib.load('ensemble_model.pkl')
+        self.encoder = self.frontier.encoder
+        self.timeout = timeout
+        self.degraded_ok = degraded_ok
+        self.pool = ThreadPoolExecutor(max_workers=self.POOL_SIZE, thread_name_prefix="ensemble")
 
         self.log("Ensemble Agent is ready")
 
+    def fan_out(
+        self,
+        calls: Dict[str, Callable[[], np.ndarray]],
+        timeout: Optional[float] = None,
+    ) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        """
+        Run each sub-agent's call on the pool, waiting at most timeout seconds for all of them,
+        and log how long each took. If a sub-agent fails or runs out of time its error is raised,
+        a TimeoutError for a timeout. With degraded_ok, the average of the others stands in for it
+        instead; only if none answered is an error raised.
+        Return each sub-agent's prices, and the names of those stood in for, so concurrent calls
+        on a shared agent each see their own.
+
+        A timed-out call can't be stopped: future.cancel() does nothing once a call is running, so
+        a hung sub-agent keeps holding its pool thread until it returns
+        """
+        timeout = timeout or self.timeout
+
+        def timed(call: Callable[[], float]) -> Tuple[float, float]:
+            start = time.perf_counter()
+            result = call()
+            return result, time.perf_counter() - start
+
+        start = time.perf_counter()
+        futures = {name: self.pool.submit(timed, call) for name, call in calls.items()}
+        wait(futures.values(), timeout=timeout)
+
+        results, timings, errors = {}, [], []
+        for name, future in futures.items():
+            if not future.done():
+                future.cancel()
+                errors.append(TimeoutError(f"{name} did not answer within {timeout:.0f}s"))
+                timings.append(f"{name} timed out")
+            elif future.exception() is not None:
+                errors.append(future.exception())
+                timings.append(f"{name} failed ({future.exception()!r})")
+            else:
+                result, seconds = future.result()
+                results[name] = np.asarray(result, dtype=float)
+                timings.append(f"{name} {seconds:.2f}s")
+        self.log(f"Ensemble Agent sub-agent timings: {', '.join(timings)}; {time.perf_counter() - start:.2f}s in all")
+
+        degraded = [name for name in calls if name not in results]
+        if errors and (not self.degraded_ok or not results):
+            raise errors[0]
+        if degraded:
+            self.log(f"Ensemble Agent degraded - standing in for {', '.join(degraded)} with the average of the others")
+        fallback = sum(results.values()) / len(results)
+        return {name: results.get(name, fallback) for name in calls}, degraded
+
     def price(self, description: str) -> float:
         """
         Run the ensemble model:
-        - Ask each sub-agent to price the product
+        - Ask each sub-agent to price the product, all at once
         - Feed those predictions to the linear model
         - Return the final weighted price
 
@@ -61,17 +141,54 @@ class EnsembleAgent(Agent):
         """
         self.log("Running Ensemble Agent - collaborating with specialist, frontier, and random forest agents")
 
-        specialist = self.specialist.price(description)
-        frontier = self.frontier.price(description)
-        random_forest = self.random_forest.price(description)
-        
-        X = pd.DataFrame({
-            'Specialist': [specialist],
-            'Frontier': [frontier],
-            'RandomForest': [random_forest],
-            'Min': [min(specialist, frontier, random_forest)],
-            'Max': [max(specialist, frontier, random_forest)],
+        vector = self.encoder.encode([description])
+        shared = self.random_forest.vectorizer is self.encoder
+        prices, degraded = self.fan_out({
+            "specialist": lambda: self.specialist.price(description),
+            "frontier": lambda: self.frontier.price(description, vector=vector),
+            "random forest": lambda: self.random_forest.price(description, vector=vector if shared else None),
         })
-        y = max(0, self.model.predict(X)[0])
-        self.log(f"Ensemble Agent complete - returning ${y:.2f}")
-        return y
\ No newline at end of file
+        y = float(self.combine(prices["specialist"], prices["frontier"], prices["random forest"]))
+        self.log(f"Ensemble Agent complete - returning ${y:.2f}{' (degraded)' if degraded else ''}")
+        return y
+
+    def price_batch(self, descriptions: List[str]) -> List[float]:
+        """
+        Run the ensemble model over a batch of products: embed them all once, have each sub-agent
+        price the whole batch concurrently with the others, and combine the predictions in one go.
+        The sub-agents get timeout seconds per description
+
+        :param descriptions: the descriptions of the products
+        :return: estimates of their prices, in the order of the descriptions
+        """
+        if not descriptions:
+            return []
+        self.log(f"Running Ensemble Agent on a batch of {len(descriptions)} products")
+
+        vectors = self.encoder.encode(descriptions)
+        shared = self.random_forest.vectorizer is self.encoder
+        prices, degraded = self.fan_out({
+            "specialist": lambda: self.specialist.price_batch(descriptions),
+            "frontier": lambda: self.frontier.price_batch(descriptions, vectors=vectors),
+            "random forest": lambda: self.random_forest.price_batch(descriptions, vectors=vectors if shared else None),
+        }, timeout=self.timeout * len(descriptions))
+        y = self.combine(prices["specialist"], prices["frontier"], prices["random forest"])
+        self.log(f"Ensemble Agent complete - returning {len(y)} estimates{' (degraded)' if degraded else ''}")
+        return y.tolist()
+
+    def combine(self, specialist, frontier, random_forest) -> np.ndarray:
+        """
+        Apply the linear model to the sub-agents' predictions, as scalars or arrays, with a matrix
+        product over its coefficients instead of a DataFrame per call; estimates are floored at 0
+        """
+        specialist, frontier, random_forest = np.broadcast_arrays(*(np.asarray(p, dtype=float) for p in (specialist, frontier, random_forest)))
+        features = {
+            "Specialist": specialist,
+            "Frontier": frontier,
+            "RandomForest": random_forest,
+            "Min": np.minimum(np.minimum(specialist, frontier), random_forest),
+            "Max": np.maximum(np.maximum(specialist, frontier), random_forest),
+        }
+        names = getattr(self.model, "feature_names_in_", self.FEATURES)
+        X = np.stack([features[name] for name in names], axis=-1)
+        return np.maximum(0, X @ self.model.coef_ + self.model.intercept_)
\ No newline at end of file
@@ -2,25 +2,30 @@
 FrontierAgent
 
 RAG-style agent:
-- Encodes query description with SentenceTransformer
-- Retrieves similar products from Chroma
+- Encodes query description with the shared SentenceTransformer embedder, unless given its vector
+- Retrieves similar products from a VectorIndex: the Chroma collection, or an in-process MatrixIndex
 - Calls OpenAI or DeepSeek chat model with those examples as context
 - Extracts a numeric price from the model's answer
+
+price_batch embeds and searches a whole batch of descriptions at once, then makes the chat
+calls for it concurrently.
 """
 
 
 import os
 import re
-import torch
-from typing import List, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 
 from openai import OpenAI
-from sentence_transformers import SentenceTransformer
 import chromadb
+import numpy as np
 from chromadb.api.models.Collection import Collection
 
 from price_intel.agents.agent import Agent
 from price_intel.data.env_setup import setup_environment
+from price_intel.vectorstore.embedder import shared_embedder
+from price_intel.vectorstore.vector_index import ChromaIndex, PriceBand, VectorIndex
 
 # Load API keys from .env and set environment variables
 setup_environment()
@@ -31,14 +36,16 @@ class FrontierAgent(Agent):
     color = Agent.BLUE
 
     DEFAULT_MODEL = "gpt-4o-mini"
+    LLM_CONCURRENCY = 8  # Chat calls in flight at once for a batch
     EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
     
-    def __init__(self, collection: Collection):
+    def __init__(self, collection: Collection, index: Optional[VectorIndex] = None):
         """
         Set up this instance by connecting to OpenAI or DeepSeek, to the Chroma datastore,
         and initializing the embedding model.
 
         :param collection: a Chroma collection containing product documents & metadata
+        :param index: the index to look up similar products in, defaulting to the Chroma collection
         """
         self.log("Initializing Frontier Agent")
 
@@ -64,13 +71,13 @@ class FrontierAgent(Agent):
 
 
         self.collection = collection
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.encoder = SentenceTransformer(self.EMBEDDING_MODEL, device=device)
+        self.index = index or ChromaIndex(collection)
+        self.encoder = shared_embedder(self.EMBEDDING_MODEL)
 
 
         self.log(
             f"Frontier Agent is ready "
-            f"(llm='{self.MODEL}', embedding_model='{self.EMBEDDING_MODEL}')"
+            f"(llm='{self.MODEL}', embedding_model='{self.EMBEDDING_MODEL}', index='{type(self.index).__name__}')"
         )
 
 
@@ -108,18 +115,27 @@ class FrontierAgent(Agent):
             {"role": "assistant", "content": "Price is $"}
         ]
 
-    def find_similars(self, description: str, k: int = 5) -> Tuple[List[str], List[float]]:
+    def find_similars(
+        self,
+        description: str,
+        k: int = 5,
+        category: Optional[str] = None,
+        price_band: Optional[PriceBand] = None,
+        vector: Optional[np.ndarray] = None,
+    ) -> Tuple[List[str], List[float]]:
         """
-        Return a list of items similar to the given one by looking in the Chroma datastore
+        Return a list of items similar to the given one by looking in the vector index,
+        only among products of this category and price band if they're given.
+        The description is embedded unless its vector is passed in
         """
-        self.log("Frontier Agent is performing a RAG search of the Chroma datastore to find {k} similar products")
-        vector = self.encoder.encode([description])  # shape (1, d)
-        results = self.collection.query(
-            query_embeddings=vector.astype(float).tolist(),
-            n_results=k,
-        )
-        documents = results['documents'][0][:]
-        prices = [m['price'] for m in results['metadatas'][0][:]]
+        self.log(f"Frontier Agent is performing a RAG search of the {type(self.index).__name__} to find {k} similar products")
+        if vector is None:
+            vector = self.encoder.encode([description])  # shape (1, d), float32
+        categories = [category] if category else None
+        documents, prices = self.index.search(vector, k, categories=categories, price_band=price_band)[0]
+        if not documents and (categories or price_band):
+            self.log("Frontier Agent found nothing matching the hints, searching all products")
+            documents, prices = self.index.search(vector, k)[0]
         self.log("Frontier Agent has found similar products")
         return documents, prices
 
@@ -133,15 +149,32 @@ class FrontierAgent(Agent):
         match = re.search(r"[-+]?\d*\.\d+|\d+", s)
         return float(match.group()) if match else 0.0
 
-    def price(self, description: str) -> float:
+    def price(
+        self,
+        description: str,
+        category: Optional[str] = None,
+        price_band: Optional[PriceBand] = None,
+        vector: Optional[np.ndarray] = None,
+    ) -> float:
         """
         Make a call to OpenAI or DeepSeek to estimate the price of the described product,
         by looking up k similar products and including them in the prompt to give context
         :param description: description of the product
+        :param category: the product's category, to look for similar products only there
+        :param price_band: the lowest and highest price of similar products to look for
+        :param vector: the description's embedding, if the caller already has it
         :return: predicted price (float)
         """
-        documents, prices = self.find_similars(description, k=5)
+        documents, prices = self.find_similars(description, k=5, category=category, price_band=price_band, vector=vector)
         self.log(f"Frontier Agent is about to call {self.MODEL} with context including 5 similar products")
+        result = self.ask(description, documents, prices)
+        self.log(f"Frontier Agent completed - predicting ${result:.2f}")
+        return result
+
+    def ask(self, description: str, documents: List[str], prices: List[float]) -> float:
+        """
+        Ask the chat model to price the described product, given similar products as context
+        """
         response = self.client.chat.completions.create(
             model=self.MODEL, 
             messages=self.messages_for(description, documents, prices),
@@ -149,6 +182,22 @@ class FrontierAgent(Agent):
             max_tokens=5
         )
         reply = response.choices[0].message.content
-        result = self.get_price(reply)
-        self.log(f"Frontier Agent completed - predicting ${result:.2f}")
-        return result
\ No newline at end of file
+        return self.get_price(reply)
+
+    def price_batch(self, descriptions: List[str], vectors: Optional[np.ndarray] = None) -> List[float]:
+        """
+        Estimate the prices of these products: embed them in one batch unless their vectors are
+        passed in, look up all their similar products in one index search, then ask the chat model
+        about them LLM_CONCURRENCY at a time
+        :param descriptions: descriptions of the products
+        :param vectors: the descriptions' embeddings, if the caller already has them
+        :return: predicted prices, in the order of the descriptions
+        """
+        self.log(f"Frontier Agent is pricing a batch of {len(descriptions)} products")
+        if vectors is None:
+            vectors = self.encoder.encode(descriptions)
+        similars = self.index.search(vectors, k=5)
+        with ThreadPoolExecutor(max_workers=self.LLM_CONCURRENCY) as pool:
+            results = list(pool.map(self.ask, descriptions, *zip(*similars)))
+        self.log(f"Frontier Agent completed a batch of {len(results)} predictions")
+        return results
\ No newline at end of file
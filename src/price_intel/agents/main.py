@@ -11,6 +11,7 @@ from sklearn.manifold import TSNE
 
 from price_intel.agents.planning_agent import PlanningAgent
 from price_intel.agents.deals import Opportunity
+from price_intel.vectorstore.vector_index import open_index
 
 # Colors for logging
 BG_BLUE = "\033[44m"
@@ -48,6 +49,7 @@ def init_logging():
 
 class DealAgentFramework:
     DB = "products_vectorstore"
+    INDEX = "products_index"  # Used instead of querying Chroma once built with build_index.py
     MEMORY_FILENAME = "memory.json"
 
     def __init__(self):
@@ -62,7 +64,8 @@ class DealAgentFramework:
     def init_agents_as_needed(self):
         if not self.planner:
             self.log("Initializing Agent Framework")
-            self.planner = PlanningAgent(self.collection)
+            index = open_index(self.INDEX) if os.path.exists(self.INDEX) else None
+            self.planner = PlanningAgent(self.collection, index=index)
             self.log("Agent Framework is ready")
 
     def read_memory(self) -> List[Opportunity]:
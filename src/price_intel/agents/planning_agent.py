@@ -4,6 +4,7 @@ from price_intel.agents.deals import Deal, Opportunity
 from price_intel.agents.scanner_agent import ScannerAgent
 from price_intel.agents.ensemble_agent import EnsembleAgent
 from price_intel.agents.messaging_agent import MessagingAgent
+from price_intel.vectorstore.vector_index import VectorIndex
 
 
 class PlanningAgent(Agent):
@@ -12,13 +13,13 @@ class PlanningAgent(Agent):
     color = Agent.GREEN
     DEAL_THRESHOLD = 50.0
 
-    def __init__(self, collection):
+    def __init__(self, collection, index: Optional[VectorIndex] = None):
         """
         Create instances of the 3 Agents that this planner coordinates across
         """
         self.log("Planning Agent is initializing")
         self.scanner = ScannerAgent()
-        self.ensemble = EnsembleAgent(collection)
+        self.ensemble = EnsembleAgent(collection, index=index)
         self.messenger = MessagingAgent()
         self.log("Planning Agent is ready")
 
@@ -34,6 +35,21 @@ class PlanningAgent(Agent):
         self.log(f"Planning Agent has processed a deal with discount ${discount:.2f}")
         return Opportunity(deal=deal, estimate=estimate, discount=discount)
 
+    def run_batch(self, deals: List[Deal]) -> List[Opportunity]:
+        """
+        Run the workflow for several deals at once, pricing them in one ensemble batch
+        :param deals: the deals, summarized from an RSS scrape
+        :returns: an opportunity for each deal, including its discount
+        """
+        self.log(f"Planning Agent is pricing up {len(deals)} potential deals")
+        estimates = self.ensemble.price_batch([deal.product_description for deal in deals])
+        opportunities = [
+            Opportunity(deal=deal, estimate=estimate, discount=estimate - deal.price)
+            for deal, estimate in zip(deals, estimates)
+        ]
+        self.log(f"Planning Agent has processed {len(opportunities)} deals")
+        return opportunities
+
     def plan(self, memory: Optional[List[Opportunity]] = None) -> Optional[Opportunity]:
         """
         Run the full workflow:
@@ -49,7 +65,7 @@ class PlanningAgent(Agent):
         self.log("Planning Agent is kicking off a run")
         selection = self.scanner.scan(memory=memory)
         if selection:
-            opportunities = [self.run(deal) for deal in selection.deals[:5]]
+            opportunities = self.run_batch(selection.deals[:5])
             opportunities.sort(key=lambda opp: opp.discount, reverse=True)
             best = opportunities[0]
             self.log(f"Planning Agent has identified the best deal has discount ${best.discount:.2f}")
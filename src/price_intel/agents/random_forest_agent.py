@@ -3,14 +3,16 @@ RandomForestAgent
 
 Uses a pre-trained RandomForestRegressor on sentence-transformer embeddings
 to estimate the price of a product from its description.
+Descriptions are embedded by the shared embedder, unless their vectors are passed in.
 """
 
 import os
-import torch
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
+from typing import List, Optional
 import joblib
+import numpy as np
 from price_intel.agents.agent import Agent
+from price_intel.vectorstore.embedder import shared_embedder
 
 MODEL_DIR = Path(__file__).resolve().parents[3] / "models"
 
@@ -42,9 +44,7 @@ class RandomForestAgent(Agent):
                 f"Train it with the training script before using this agent."
             )
 
-        # self.vectorizer = SentenceTransformer(embedding_model)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.vectorizer = SentenceTransformer(embedding_model, device=device)
+        self.vectorizer = shared_embedder(embedding_model)
 
         self.model = joblib.load(model_path)
 
@@ -54,14 +54,30 @@ class RandomForestAgent(Agent):
         )
 
 
-    def price(self, description: str) -> float:
+    def price(self, description: str, vector: Optional[np.ndarray] = None) -> float:
         """
         Use a Random Forest model to estimate the price of the described item
         :param description: free-text description of the product
+        :param vector: the description's embedding, if the caller already has it
         :return: the price as a float
         """        
         self.log("Random Forest Agent is starting a prediction")
-        vector = self.vectorizer.encode([description]) # shape (1, d)
+        if vector is None:
+            vector = self.vectorizer.encode([description]) # shape (1, d)
         result = max(0, self.model.predict(vector)[0])
         self.log(f"Random Forest Agent completed - predicting ${result:.2f}")
-        return result
\ No newline at end of file
+        return result
+
+    def price_batch(self, descriptions: List[str], vectors: Optional[np.ndarray] = None) -> List[float]:
+        """
+        Estimate the prices of these items with one prediction over the matrix of their embeddings
+        :param descriptions: free-text descriptions of the products
+        :param vectors: the descriptions' embeddings, if the caller already has them
+        :return: the prices, in the order of the descriptions
+        """
+        self.log(f"Random Forest Agent is predicting a batch of {len(descriptions)} products")
+        if vectors is None:
+            vectors = self.vectorizer.encode(descriptions)
+        results = np.maximum(0, self.model.predict(vectors)).tolist()
+        self.log(f"Random Forest Agent completed a batch of {len(results)} predictions")
+        return results
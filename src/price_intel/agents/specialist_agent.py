@@ -6,6 +6,8 @@ as the "specialist" in the ensemble (alongside Frontier + RandomForest).
 """
 
 import os
+from typing import List
+
 import modal
 
 from price_intel.agents.agent import Agent
@@ -54,4 +56,17 @@ class SpecialistAgent(Agent):
         self.log("Specialist Agent is calling remote fine-tuned model")
         result = float(self.pricer.price.remote(description))
         self.log(f"Specialist Agent completed - predicting ${result:.2f}")
-        return result
\ No newline at end of file
+        return result
+
+    def price_batch(self, descriptions: List[str]) -> List[float]:
+        """
+        Estimate the prices of these items with one Modal map over the remote model,
+        which fans the descriptions out across its containers.
+
+        :param descriptions: descriptions of the products
+        :return: predicted prices, in the order of the descriptions
+        """
+        self.log(f"Specialist Agent is calling remote fine-tuned model for {len(descriptions)} products")
+        results = [float(result) for result in self.pricer.price.map(descriptions)]
+        self.log(f"Specialist Agent completed a batch of {len(results)} predictions")
+        return results
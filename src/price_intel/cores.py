@@ -0,0 +1,18 @@
+"""
+cores.py
+
+How many cores this process may run on, for sizing worker pools. Kept free of dependencies, so
+the agents can size their pools without importing the curation stack.
+"""
+
+import os
+
+
+def default_workers() -> int:
+    """
+    One worker process per core available to this process
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
@@ -4,9 +4,20 @@ aggregate_items.py
 Loads multiple datasets using ItemLoader and aggregates them into a single list of Items.
 """
 
-from typing import List
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, List, Optional
+from tqdm import tqdm
+from price_intel.cores import default_workers
 from price_intel.data.items import Item
-from price_intel.data.loaders import ItemLoader
+from price_intel.data.profiling import Profiler
+from price_intel.data.loaders import (
+    IN_FLIGHT_PER_WORKER,
+    PARSE_CACHE_DIR,
+    ItemLoader,
+    make_pool,
+    run_tasks,
+)
 
 
 DATASET_NAMES = [
@@ -20,12 +31,86 @@ DATASET_NAMES = [
     "Musical_Instruments",
 ]
 
-def load_all_items(dataset_names: List[str] = DATASET_NAMES) -> List[Item]:
-    """Load all items from predefined datasets."""
+# How many datasets may be opening at once, ahead of the categories being parsed
+OPEN_AHEAD = 2
+
+def item_bytes(item: Item) -> int:
+    """
+    Approximate memory held by one Item: the slotted object plus the title, price and prompt it owns.
+    Category strings are shared across a category and token counts are small cached ints
+    """
+    return sys.getsizeof(item) + sum(sys.getsizeof(getattr(item, name)) for name in ("title", "price", "prompt"))
+
+
+def report_memory(items: List[Item], sample_size: int = 10_000) -> float:
+    """Print and return the average memory per item, measured over an even sample of the items."""
+    if not items:
+        return 0.0
+    sample = items[:: max(1, len(items) // sample_size)]
+    per_item = sum(item_bytes(item) for item in sample) / len(sample)
+    print(f"✓ Items hold ≈{per_item:,.0f} bytes each, ≈{per_item * len(items) / 1e9:.2f} GB in total.")
+    return per_item
+
+
+def interleave(opening: List[Future]) -> Iterator[tuple]:
+    """
+    Round-robin the parse tasks of every dataset that has finished opening,
+    only blocking on the next dataset when no opened one has tasks left.
+    """
+    pending = list(opening)
+    active = []
+    while pending or active:
+        for future in [future for future in pending if future.done()]:
+            pending.remove(future)
+            active.append(future.result().chunk_generator())
+        if not active:
+            active.append(pending.pop(0).result().chunk_generator())
+        for generator in list(active):
+            task = next(generator, None)
+            if task is None:
+                active.remove(generator)
+            else:
+                yield task
+
+
+def load_all_items(
+    dataset_names: List[str] = DATASET_NAMES,
+    workers: Optional[int] = None,
+    cache_dir: Optional[str] = PARSE_CACHE_DIR,
+    profiler: Optional[Profiler] = None,
+    token_ids: bool = False,
+) -> List[Item]:
+    """
+    Load all items from predefined datasets.
+    All categories feed one shared pool of worker processes (one per core by default):
+    datasets open in background threads while earlier categories are still parsing,
+    and their chunks are interleaved so no core waits on a single category.
+    Chunks already parsed under the same dataset fingerprint and parsing rules are read
+    from cache_dir instead, so a rerun only parses what changed.
+    If a profiler is given, each category's open time and chunk timings are recorded in it.
+    If token_ids is set, Items keep the token ids of their prompts for a pre-tokenized export.
+    """
+    workers = workers or default_workers()
+    loaders = [ItemLoader(name, cache_dir, token_ids) for name in dataset_names]
+    chunks = {name: {} for name in dataset_names}
+    # The pool's workers are forked before the opener threads start, see make_pool
+    with make_pool(workers) as pool, ThreadPoolExecutor(max_workers=OPEN_AHEAD) as opener:
+        opening = [opener.submit(loader.open) for loader in loaders]
+        tasks = run_tasks(pool, interleave(opening), workers * IN_FLIGHT_PER_WORKER)
+        for task, batch in tqdm(tasks, unit="chunk"):
+            chunks[task.name][task.start] = batch
+            if profiler is not None:
+                profiler.record_chunk(task.name, task.stop - task.start, len(batch.titles), batch.stats)
+
+    if profiler is not None:
+        for loader in loaders:
+            profiler.record_open(loader.name, loader.open_seconds)
+
     all_items = []
-    for name in dataset_names:
-        loader = ItemLoader(name)
-        items = loader.load()
+    for loader in loaders:
+        items = loader.assemble(chunks[loader.name])
+        print(f"Completed {loader.name} with {len(items):,} datapoints", flush=True)
         all_items.extend(items)
     print(f"✓ Loaded total of {len(all_items):,} items across {len(dataset_names)} categories.")
+    report_memory(all_items)
     return all_items
\ No newline at end of file
@@ -2,38 +2,63 @@
 curate_data.py
 
 Full pipeline orchestration: setup environment, load datasets, sample, split, and save.
+
+    python -m price_intel.data.curate_data [--token-ids]
+
+With --token-ids the saved splits are pre-tokenized for the specialist fine-tune.
 """
 
+import argparse
+
 from price_intel.data.env_setup import setup_environment, login_huggingface
 from price_intel.data.aggregate_items import load_all_items
+from price_intel.data.profiling import Profiler
 from price_intel.data.sampling_and_split import (
     make_price_slots,
     balanced_sample,
     summarize_categories,
     split_train_test,
-    save_pickle,
+    save_item_store,
 )
 
-def main():
+PROFILE_PATH = "curation_profile.json"
+
+def main(token_ids: bool = False):
+    profiler = Profiler()
+
     # 1. Environment setup and Hugging Face login
-    setup_environment()
-    login_huggingface()
+    with profiler.stage("setup"):
+        setup_environment()
+        login_huggingface()
 
     # 2. Load all items
-    items = load_all_items()
+    with profiler.stage("load_all_items") as stage:
+        items = load_all_items(profiler=profiler, token_ids=token_ids)
+        stage["rows_out"] = len(items)
 
-    # 3. Create balanced sample
-    slots = make_price_slots(items)
-    sample = balanced_sample(slots)
+    # 3. Create balanced sample (row indices into items)
+    with profiler.stage("balanced_sample", rows_in=len(items)) as stage:
+        slots = make_price_slots(items)
+        sample = balanced_sample(slots)
+        stage["rows_out"] = len(sample)
 
     # 4. Inspect category distribution
-    summarize_categories(sample)
+    summarize_categories(slots, sample)
 
     # 5. Split into train/test
-    train, test = split_train_test(sample)
+    with profiler.stage("split_train_test", rows_in=len(sample)) as stage:
+        train, test = split_train_test(sample)
+        stage["rows_out"] = len(train) + len(test)
 
     # 6. Save to disk
-    save_pickle(train, test, prefix="amazon_items")
+    with profiler.stage("save_item_store", rows_in=len(train) + len(test)) as stage:
+        save_item_store((items[i] for i in train), (items[i] for i in test), prefix="amazon_items", token_ids=token_ids)
+        stage["rows_out"] = len(train) + len(test)
+
+    # 7. Write the profiling report
+    profiler.write(PROFILE_PATH)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--token-ids", action="store_true", help="store packed prompt token ids next to the text")
+    main(parser.parse_args().token_ids)
@@ -0,0 +1,164 @@
+"""
+item_store.py
+
+Columnar storage for curated Items.
+
+A split is written once as an Arrow IPC file with one column per field. Readers memory-map
+the file and pick the columns they need, so loading the train split neither unpickles
+400k Python objects nor pages in text columns that are never read.
+
+A store can also be pre-tokenized: each row then carries the token ids of its prompt packed into
+a fixed-width int32 row, and the offset where the price labels start. token_count is the
+attention length of the row, so a trainer can memory-map the store and skip tokenizing.
+In every store, token_count counts the prompt's tokens as the tokenizer encodes it, BOS included.
+A pre-tokenized store is written as a single record batch rather than streamed, so its token ids
+are one contiguous matrix in the file that token_arrays hands out without copying.
+"""
+
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+
+from price_intel.data.items import PACKED_WIDTH, Item, pack_token_ids
+
+SCHEMA = pa.schema(
+    [
+        ("title", pa.string()),
+        ("description", pa.string()),
+        ("prompt", pa.string()),
+        ("price", pa.float64()),
+        ("category", pa.string()),
+        ("token_count", pa.int32()),
+    ]
+)
+
+TOKEN_SCHEMA = SCHEMA.append(pa.field("input_ids", pa.list_(pa.int32(), PACKED_WIDTH))).append(
+    pa.field("label_start", pa.int32())
+)
+
+BATCH_SIZE = 10_000
+
+
+def description_of(prompt: str) -> str:
+    """
+    Remove the question and the price answer from a prompt, leaving only the item description
+    """
+    text = prompt.replace(f"{Item.QUESTION}\n\n", "")
+    return text.split(f"\n\n{Item.PREFIX}")[0]
+
+
+class StoredItem:
+    """
+    A read-only, Item-compatible view of one row of an ItemStore.
+    Fields whose columns were not read are None
+    """
+
+    __slots__ = tuple(TOKEN_SCHEMA.names)
+
+    PREFIX = Item.PREFIX
+    QUESTION = Item.QUESTION
+    include = True
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    test_prompt = Item.test_prompt
+    __repr__ = Item.__repr__
+
+
+class ItemStore:
+    """
+    A curated split of Items held as memory-mapped Arrow columns
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def write(cls, items: Iterable[Item], path: str, batch_size: Optional[int] = None, token_ids: bool = False) -> "ItemStore":
+        """
+        Write these Items to path, batch_size rows at a time (BATCH_SIZE by default), and return the store.
+        If token_ids is set, the Items must have been parsed with token ids, and the store is pre-tokenized.
+        It is then written as one batch, holding the whole split in memory, and batch_size can't be given
+        """
+        schema = TOKEN_SCHEMA if token_ids else SCHEMA
+        if token_ids and batch_size is not None:
+            raise ValueError("A pre-tokenized store is written as one batch; batch_size can't be given with token_ids")
+        if not token_ids:
+            batch_size = batch_size or BATCH_SIZE
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            rows = []
+            for item in items:
+                rows.append(item)
+                if len(rows) == batch_size:
+                    writer.write_batch(cls._to_batch(rows, schema))
+                    rows = []
+            if rows:
+                writer.write_batch(cls._to_batch(rows, schema))
+        return cls(path)
+
+    @staticmethod
+    def _to_batch(items: Sequence[Item], schema: pa.Schema = SCHEMA) -> pa.RecordBatch:
+        columns = {
+            "title": [item.title for item in items],
+            "description": [description_of(item.prompt) for item in items],
+            "prompt": [item.prompt for item in items],
+            "price": [item.price for item in items],
+            "category": [item.category for item in items],
+            "token_count": [item.token_count for item in items],
+        }
+        if schema is TOKEN_SCHEMA:
+            if any(item.token_ids is None or item.label_start is None for item in items):
+                raise ValueError("Writing a pre-tokenized store needs Items parsed with token_ids=True")
+            packed = pack_token_ids([item.token_ids for item in items])
+            columns["input_ids"] = pa.FixedSizeListArray.from_arrays(pa.array(packed.ravel()), PACKED_WIDTH)
+            columns["label_start"] = [item.label_start for item in items]
+        return pa.RecordBatch.from_pydict(columns, schema=schema)
+
+    def table(self, columns: Optional[List[str]] = None) -> pa.Table:
+        """
+        Memory-map the store and return it as a Table, restricted to these columns if given.
+        No column data is copied; pages are only read from disk when a column is accessed
+        """
+        with pa.memory_map(self.path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.select(columns) if columns else table
+
+    def column(self, name: str) -> pa.ChunkedArray:
+        return self.table([name]).column(name)
+
+    def iter_batches(self, columns: Optional[List[str]] = None) -> Iterator[pa.RecordBatch]:
+        """
+        Yield the store as record batches, in the order they were written
+        """
+        yield from self.table(columns).to_batches()
+
+    def items(self, columns: Optional[List[str]] = None) -> List[StoredItem]:
+        """
+        Return the rows as StoredItem views, for callers that expect a list of Items
+        """
+        table = self.table(columns)
+        names = table.column_names
+        values = [table.column(name).to_pylist() for name in names]
+        return [StoredItem(**dict(zip(names, row))) for row in zip(*values)]
+
+    def token_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return the packed input ids (rows, PACKED_WIDTH), the attention lengths and the label starts
+        of a pre-tokenized store as int32 arrays: zero-copy views of its one memory-mapped record batch
+        """
+        table = self.table(["input_ids", "token_count", "label_start"])
+        if table.num_rows == 0:
+            return np.empty((0, PACKED_WIDTH), dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        if table.column("input_ids").num_chunks != 1:
+            raise ValueError(f"{self.path} was not written as one pre-tokenized batch; write it again with ItemStore.write")
+        return (
+            table.column("input_ids").chunk(0).flatten().to_numpy().reshape(-1, PACKED_WIDTH),
+            table.column("token_count").chunk(0).to_numpy(),
+            table.column("label_start").chunk(0).to_numpy(),
+        )
+
+    def __len__(self) -> int:
+        return self.table().num_rows
@@ -1,43 +1,101 @@
-from typing import Optional
-from transformers import AutoTokenizer
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import hashlib
+import json
 import re
+import numpy as np
 
 BASE_MODEL = "meta-llama/Meta-Llama-3.1-8B"
 
 MIN_TOKENS = 150 # Any less than this, and we don't have enough useful content
 MAX_TOKENS = 160 # Truncate after this many tokens. Then after adding in prompt text, we will get to around 180 tokens
 
+# Pre-tokenized prompts are packed into rows of this many token ids, padded with PAD_ID after token_count
+PACKED_WIDTH = 192
+PAD_ID = 0
+
 MIN_CHARS = 300
 CEILING_CHARS = MAX_TOKENS * 7
 
+# Runs of punctuation and whitespace that scrub collapses to a single space
+PUNCTUATION = re.compile(r'[:\[\]"{}【】\s]+')
+
+# ASCII fast path for scrub, working on bytes: the punctuation plus the control characters that
+# str.isspace() accepts but bytes.split() doesn't, all mapped to spaces
+ASCII_PUNCTUATION = bytes.maketrans(b':[]"{}\x1c\x1d\x1e\x1f', b" " * 10)
+
+# A word of 7+ characters containing a digit, with the space before it. In ASCII text str.isdigit() is exactly [0-9]
+PRODUCT_NUMBER = re.compile(rb" (?=[^ ]{7})[^ 0-9]*[0-9][^ ]*")
+
+# Bump this when a change to the parsing code alters its output, so that cached parses are invalidated
+PARSE_VERSION = 3
+
+_tokenizer = None
+
+
+def get_tokenizer():
+    """
+    Return the tokenizer used to parse Items, loading it the first time parsing needs it
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        from transformers import AutoTokenizer
+        _tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL, trust_remote_code=True)
+    return _tokenizer
+
+
+def set_tokenizer(tokenizer):
+    """
+    Install an already loaded tokenizer, such as one handed to a worker process by its pool initializer
+    """
+    global _tokenizer
+    _tokenizer = tokenizer
+    rules_fingerprint.cache_clear()
+
+
 class Item:
     """
-    An Item is a cleaned, curated datapoint of a Product with a Price
+    An Item is a cleaned, curated datapoint of a Product with a Price.
+    Items are slotted and keep only what is used downstream: the raw description,
+    features and details are dropped once the prompt has been built.
+    token_count is the length of the prompt as the tokenizer encodes it, BOS included:
+    what a trainer feeds the model for it
     """
-    
-    tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL, trust_remote_code=True)
+
+    __slots__ = ("title", "price", "category", "token_count", "prompt", "include", "token_ids", "label_start")
+
     PREFIX = "Price is $"
     QUESTION = "How much does this cost to the nearest dollar?"
     REMOVALS = ['"Batteries Included?": "No"', '"Batteries Included?": "Yes"', '"Batteries Required?": "No"', '"Batteries Required?": "Yes"', "By Manufacturer", "Item", "Date First", "Package", ":", "Number of", "Best Sellers", "Number", "Product "]
 
     title: str
     price: float
-    category: str
-    token_count: int = 0
-    details: Optional[str]
-    prompt: Optional[str] = None
-    include = False
+    category: Optional[str]
+    token_count: int
+    prompt: Optional[str]
+    include: bool
+    token_ids: Optional[Sequence[int]]
+    label_start: Optional[int]
 
-    def __init__(self, data, price):
+    def __init__(self, data, price, parse=True):
         self.title = data['title']
         self.price = price
-        self.parse(data)
+        self.category = None
+        self.token_count = 0
+        self.prompt = None
+        self.include = False
+        self.token_ids = None
+        self.label_start = None
+        if parse:
+            self.parse(data)
 
-    def scrub_details(self):
+    def scrub_details(self, details):
         """
-        Clean up the details string by removing common text that doesn't add value
+        Clean up the details string by removing common text that doesn't add value.
+        These stay as sequential str.replace calls: each is a fast C scan, they beat a single
+        alternation regex, and a removal can join text into a later one, which only the
+        sequential order reproduces exactly
         """
-        details = self.details
         for remove in self.REMOVALS:
             details = details.replace(remove, "")
         return details
@@ -45,18 +103,24 @@ class Item:
     def scrub(self, stuff):
         """
         Clean up the provided text by removing unnecessary characters and whitespace
-        Also remove words that are 7+ chars and contain numbers, as these are likely irrelevant product numbers
+        Also remove words that are 7+ chars and contain numbers, as these are likely irrelevant product numbers.
+        ASCII text (nearly all of it) takes a fast path with the same output: one byte translate and split for the
+        punctuation, and one precompiled regex pass for the product numbers instead of a per-character scan
         """
-        stuff = re.sub(r'[:\[\]"{}【】\s]+', ' ', stuff).strip()
+        if stuff.isascii():
+            text = b" ".join(stuff.encode("ascii").translate(ASCII_PUNCTUATION).split())
+            text = text.replace(b" ,", b",").replace(b",,,", b",").replace(b",,", b",")
+            return PRODUCT_NUMBER.sub(b"", b" " + text)[1:].decode("ascii")
+        stuff = PUNCTUATION.sub(' ', stuff).strip()
         stuff = stuff.replace(" ,", ",").replace(",,,",",").replace(",,",",")
         words = stuff.split(' ')
         select = [word for word in words if len(word)<7 or not any(char.isdigit() for char in word)]
         return " ".join(select)
     
-    def parse(self, data):
+    def build_text(self, data) -> Optional[str]:
         """
-        Parse this datapoint and if it fits within the allowed Token range,
-        then set include to True
+        Assemble the scrubbed title and contents of this datapoint, ready for tokenizing.
+        Return None if there isn't enough content for it to be worth including
         """
         contents = '\n'.join(data['description'])
         if contents:
@@ -64,26 +128,97 @@ class Item:
         features = '\n'.join(data['features'])
         if features:
             contents += features + '\n'
-        self.details = data['details']
-        if self.details:
-            contents += self.scrub_details() + '\n'
+        details = data['details']
+        if details:
+            contents += self.scrub_details(details) + '\n'
         if len(contents) > MIN_CHARS:
             contents = contents[:CEILING_CHARS]
-            text = f"{self.scrub(self.title)}\n{self.scrub(contents)}"
-            tokens = self.tokenizer.encode(text, add_special_tokens=False)
+            return f"{self.scrub(self.title)}\n{self.scrub(contents)}"
+        return None
+
+    def parse(self, data):
+        """
+        Parse this datapoint and if it fits within the allowed Token range,
+        then set include to True
+        """
+        text = self.build_text(data)
+        if text is not None:
+            tokenizer = get_tokenizer()
+            tokens = tokenizer.encode(text, add_special_tokens=False)
             if len(tokens) > MIN_TOKENS:
                 tokens = tokens[:MAX_TOKENS]
-                text = self.tokenizer.decode(tokens)
-                self.make_prompt(text)
+                self.make_prompt(tokenizer.decode(tokens))
+                self.tokenize_prompts([self])
                 self.include = True
 
+    @classmethod
+    def parse_batch(cls, items: List["Item"], texts: List[str], token_ids: bool = False) -> List["Item"]:
+        """
+        Tokenize the scrubbed texts of a batch of Items with a single call to the fast tokenizer,
+        then truncate, decode and build the prompts for those within the allowed Token range,
+        and count the tokens of the finished prompts with a second call, see tokenize_prompts.
+        If token_ids is set, the Items also keep those token ids.
+        Return the Items that should be included
+        """
+        if not items:
+            return []
+        tokenizer = get_tokenizer()
+        encoded = tokenizer(texts, add_special_tokens=False)["input_ids"]
+        kept = []
+        truncated = []
+        for item, tokens in zip(items, encoded):
+            if len(tokens) > MIN_TOKENS:
+                kept.append(item)
+                truncated.append(tokens[:MAX_TOKENS])
+        for item, text in zip(kept, tokenizer.batch_decode(truncated)):
+            item.make_prompt(text)
+            item.include = True
+        if kept:
+            cls.tokenize_prompts(kept, token_ids)
+        return kept
+
+    @classmethod
+    def tokenize_prompts(cls, items: List["Item"], token_ids: bool = False):
+        """
+        Tokenize the whole prompts of these Items with a single call to the fast tokenizer, special
+        tokens included, and set each token count from the result. Pieces encoded apart don't add up
+        to the prompt: BOS is missing, the tokenizer merges punctuation with the "\n\n" that follows it,
+        and decoded text doesn't always re-encode to the same length.
+        If token_ids is set, each Item also keeps those ids, exactly what a trainer would get from its
+        prompt, and the position of its first price label: the first token to reach past PREFIX
+        """
+        encoded = get_tokenizer()([item.prompt for item in items], return_offsets_mapping=token_ids)
+        for i, (item, ids) in enumerate(zip(items, encoded["input_ids"])):
+            item.token_count = len(ids)
+            if token_ids:
+                prefix_end = item.prompt.rindex(cls.PREFIX) + len(cls.PREFIX)
+                offsets = encoded["offset_mapping"][i]
+                item.token_ids = ids
+                item.label_start = next((j for j, (_, end) in enumerate(offsets) if end > prefix_end), len(ids))
+
+    @classmethod
+    def from_fields(cls, title, price, category, prompt, token_count, token_ids=None, label_start=None) -> "Item":
+        """
+        Rebuild an included Item from the fields kept after parsing, without parsing again
+        """
+        item = cls.__new__(cls)
+        item.title = title
+        item.price = price
+        item.category = category
+        item.prompt = prompt
+        item.token_count = token_count
+        item.include = True
+        item.token_ids = token_ids
+        item.label_start = label_start
+        return item
+
     def make_prompt(self, text):
         """
         Set the prompt instance variable to be a prompt appropriate for training
         """
+        price = round(self.price)
         self.prompt = f"{self.QUESTION}\n\n{text}\n\n"
-        self.prompt += f"{self.PREFIX}{str(round(self.price))}.00"
-        self.token_count = len(self.tokenizer.encode(self.prompt, add_special_tokens=False))
+        self.prompt += f"{self.PREFIX}{str(price)}.00"
 
     def test_prompt(self):
         """
@@ -91,13 +226,108 @@ class Item:
         """
         return self.prompt.split(self.PREFIX)[0] + self.PREFIX
 
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        """
+        Restore an Item from a pickle, including pickles written before Item was slotted,
+        whose state still carries the raw details
+        """
+        self.category = None
+        self.token_count = 0
+        self.prompt = None
+        self.include = False
+        self.token_ids = None
+        self.label_start = None
+        for name, value in state.items():
+            if name in self.__slots__:
+                setattr(self, name, value)
+
     def __repr__(self):
         """
         Return a String version of this Item
         """
         return f"<{self.title} = ${self.price}>"
 
-        
 
-    
-    
\ No newline at end of file
+
+class ItemBatch(NamedTuple):
+    """
+    The Items parsed from one chunk of a category, held as columns.
+    This is the compact form in which parse workers return their results and the parse cache stores them:
+    a handful of flat lists pickles and unpickles far faster than one object per Item.
+    stats carries the worker's timings for the chunk back to the parent, and is never cached.
+    token_ids, when the Items were pre-tokenized, is a packed (items, PACKED_WIDTH) int32 array,
+    and label_starts the position of each row's first price label
+    """
+    category: str
+    titles: List[str]
+    prompts: List[str]
+    prices: List[float]
+    token_counts: List[int]
+    stats: Optional[Dict[str, float]] = None
+    token_ids: Optional[np.ndarray] = None
+    label_starts: Optional[List[int]] = None
+
+    @classmethod
+    def from_items(cls, category: str, items: List[Item], stats: Optional[Dict[str, float]] = None) -> "ItemBatch":
+        pretokenized = bool(items) and items[0].token_ids is not None
+        return cls(
+            category,
+            [item.title for item in items],
+            [item.prompt for item in items],
+            [item.price for item in items],
+            [item.token_count for item in items],
+            stats,
+            pack_token_ids([item.token_ids for item in items]) if pretokenized else None,
+            [item.label_start for item in items] if pretokenized else None,
+        )
+
+    def to_items(self) -> List[Item]:
+        """
+        Rebuild the Items of this batch; pre-tokenized Items get a view of their row of the packed token ids
+        """
+        items = [
+            Item.from_fields(title, price, self.category, prompt, token_count)
+            for title, prompt, price, token_count in zip(self.titles, self.prompts, self.prices, self.token_counts)
+        ]
+        if self.token_ids is not None:
+            for item, row, label_start in zip(items, self.token_ids, self.label_starts):
+                item.token_ids = row[:item.token_count]
+                item.label_start = label_start
+        return items
+
+
+def pack_token_ids(sequences: Sequence[Sequence[int]]) -> np.ndarray:
+    """
+    Pack token id sequences into a (len(sequences), PACKED_WIDTH) int32 array, padded with PAD_ID
+    """
+    packed = np.full((len(sequences), PACKED_WIDTH), PAD_ID, dtype=np.int32)
+    for row, ids in zip(packed, sequences):
+        if len(ids) > PACKED_WIDTH:
+            raise ValueError(f"Prompt of {len(ids)} tokens does not fit in PACKED_WIDTH={PACKED_WIDTH}")
+        row[:len(ids)] = ids
+    return packed
+
+
+@lru_cache(maxsize=None)
+def rules_fingerprint() -> str:
+    """
+    Hash of everything that decides how a datapoint is parsed into an Item: the parsing code version,
+    the details removals, the character and token limits, the prompt text and the tokenizer itself
+    """
+    tokenizer = get_tokenizer()
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    rules = [
+        PARSE_VERSION,
+        Item.REMOVALS,
+        MIN_TOKENS,
+        MAX_TOKENS,
+        MIN_CHARS,
+        CEILING_CHARS,
+        Item.QUESTION,
+        Item.PREFIX,
+        backend.to_str() if backend is not None else tokenizer.name_or_path,
+    ]
+    return hashlib.sha256(json.dumps(rules).encode()).hexdigest()[:16]
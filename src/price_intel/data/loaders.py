@@ -1,19 +1,181 @@
+import hashlib
+import json
+import math
+import os
+import pickle
+import time
 from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import pyarrow as pa
 from tqdm import tqdm
 from datasets import load_dataset
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
-from price_intel.data.items import Item
+from datasets.table import MemoryMappedTable
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from price_intel.cores import default_workers
+from price_intel.data.items import Item, ItemBatch, get_tokenizer, rules_fingerprint, set_tokenizer
+from price_intel.data.profiling import peak_rss_mb
 
 CHUNK_SIZE = 1000
 MIN_PRICE = 0.5
 MAX_PRICE = 999.49
 
+# Parsed chunks are cached here, per category, under a key of the dataset fingerprint and the parsing rules
+PARSE_CACHE_DIR = "parse_cache"
+
+# Bump this when the format of a cached chunk changes
+CACHE_VERSION = 2
+
+# How many chunks each worker may have queued, so results stream back while tasks are still being generated
+IN_FLIGHT_PER_WORKER = 4
+
+# The only columns an Item is parsed from
+COLUMNS = ["title", "description", "features", "details", "price"]
+
+# Memory-mapped tables opened by this process, keyed by their cache files
+_tables: Dict[Tuple[str, ...], pa.Table] = {}
+
+
+def open_table(cache_files: Tuple[str, ...]) -> pa.Table:
+    """
+    Memory-map the Arrow cache files of a dataset, keeping only the columns Items are parsed from.
+    Each process maps a dataset once; pages are only read for the rows it actually parses
+    """
+    table = _tables.get(cache_files)
+    if table is None:
+        tables = [MemoryMappedTable.from_file(filename).table for filename in cache_files]
+        table = pa.concat_tables(tables).select(COLUMNS)
+        _tables[cache_files] = table
+    return table
+
+
+class ParseTask(NamedTuple):
+    """
+    The rows [start, stop) of a dataset's Arrow cache, where to cache the Items parsed from them,
+    and whether the Items should keep the token ids of their prompts
+    """
+    name: str
+    cache_files: Tuple[str, ...]
+    start: int
+    stop: int
+    cache_path: Optional[str] = None
+    token_ids: bool = False
+
+
+def read_cached(path: Optional[str]) -> Optional[ItemBatch]:
+    """
+    Return the batch of Items cached at this path, or None if the chunk hasn't been parsed under this key
+    """
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def write_cached(path: str, batch: ItemBatch):
+    """
+    Cache a parsed batch, writing to a temporary file first so an interrupted run never leaves a partial chunk
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump(batch._replace(stats=None), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def parse_shard(task: ParseTask) -> ItemBatch:
+    """
+    Worker entry point: parse the rows of a dataset's Arrow cache described by this task into Items,
+    and cache them if the task has a cache path.
+    The task only carries the category name, the cache file names and the row range, and the
+    result goes back to the parent as a compact columnar batch, already tagged with its category
+    and carrying the worker's timings: wall-clock start and finish, and seconds spent reading,
+    scrubbing and tokenizing
+    """
+    stats = {"started_at": time.time(), "scrub_seconds": 0.0, "tokenize_seconds": 0.0}
+    start = time.perf_counter()
+    rows = open_table(task.cache_files).slice(task.start, task.stop - task.start).to_pylist()
+    stats["read_seconds"] = time.perf_counter() - start
+    items = ItemLoader(task.name, token_ids=task.token_ids).from_chunk(rows, stats)
+    result = ItemBatch.from_items(task.name, items, stats)
+    if task.cache_path:
+        write_cached(task.cache_path, result)
+    stats["finished_at"] = time.time()
+    stats["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def make_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Create a pool of parsing workers, each handed the tokenizer by the pool initializer.
+    A forking pool only starts its workers on the first submit, so one is made here, before the
+    caller starts any threads: a worker forked while another thread holds a lock (a dataset
+    file lock, tqdm's, an import lock) inherits it locked, and can deadlock on it
+    """
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=set_tokenizer, initargs=(get_tokenizer(),))
+    pool.submit(int).result()
+    return pool
+
+
+def run_tasks(pool: ProcessPoolExecutor, tasks: Iterable[ParseTask], max_in_flight: int) -> Iterator[Tuple[ParseTask, ItemBatch]]:
+    """
+    Submit parse tasks to the pool lazily, keeping at most max_in_flight outstanding,
+    and stream back (task, batch) pairs in the order they complete.
+    Chunks already in the parse cache are read here and never reach the pool, and come back without stats;
+    parsed batches get their submit and receive times added to the worker's stats
+    """
+    tasks = iter(tasks)
+    in_flight = {}
+    submitted = {}
+    exhausted = False
+    while True:
+        while not exhausted and len(in_flight) < max_in_flight:
+            task = next(tasks, None)
+            if task is None:
+                exhausted = True
+                continue
+            batch = read_cached(task.cache_path)
+            if batch is not None:
+                yield task, batch
+            else:
+                future = pool.submit(parse_shard, task)
+                in_flight[future] = task
+                submitted[future] = time.time()
+        if not in_flight:
+            return
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            batch = future.result()
+            batch.stats.update(submitted_at=submitted.pop(future), received_at=time.time())
+            yield in_flight.pop(future), batch
+
+
 class ItemLoader:
 
 
-    def __init__(self, name):
+    def __init__(self, name, cache_dir: Optional[str] = PARSE_CACHE_DIR, token_ids: bool = False):
+        """
+        :param name: the category of the Amazon dataset to load
+        :param cache_dir: where to cache parsed chunks, or None to always parse from scratch
+        :param token_ids: whether Items keep the token ids of their prompts, for a pre-tokenized export
+        """
         self.name = name
+        self.cache_dir = cache_dir
+        self.token_ids = token_ids
         self.dataset = None
+        self.cache_files = ()
+        self.cache_key = None
+        self.open_seconds = 0.0
+
+    def price_of(self, datapoint):
+        """
+        Return the price of this datapoint if it is within the allowed range, otherwise None
+        """
+        price_str = datapoint['price']
+        if price_str:
+            price = float(price_str)
+            if MIN_PRICE <= price <= MAX_PRICE:
+                return price
+        return None
 
     def from_datapoint(self, datapoint):
         """
@@ -21,57 +183,102 @@ class ItemLoader:
         Return the Item if successful, or None if it shouldn't be included
         """
         try:
-            price_str = datapoint['price']
-            if price_str:
-                price = float(price_str)
-                if MIN_PRICE <= price <= MAX_PRICE:
-                    item = Item(datapoint, price)
-                    return item if item.include else None
+            price = self.price_of(datapoint)
+            if price is not None:
+                item = Item(datapoint, price)
+                return item if item.include else None
         except ValueError:
             return None
 
-    def from_chunk(self, chunk):
+    def from_chunk(self, chunk, stats: Optional[Dict[str, float]] = None):
         """
-        Create a list of Items from this chunk of elements from the Dataset
+        Create a list of Items from this chunk of elements from the Dataset.
+        The whole chunk is scrubbed first, then tokenized, truncated and counted
+        in a single batch call to the tokenizer.
+        If stats is given, the seconds spent scrubbing and tokenizing are added to it
         """
-        batch = []
+        start = time.perf_counter()
+        candidates = []
+        texts = []
         for datapoint in chunk:
-            result = self.from_datapoint(datapoint)
-            if result:
-                batch.append(result)
-        return batch
+            try:
+                price = self.price_of(datapoint)
+                if price is not None:
+                    item = Item(datapoint, price, parse=False)
+                    text = item.build_text(datapoint)
+                    if text is not None:
+                        candidates.append(item)
+                        texts.append(text)
+            except ValueError:
+                continue
+        scrubbed = time.perf_counter()
+        items = Item.parse_batch(candidates, texts, self.token_ids)
+        if stats is not None:
+            stats["scrub_seconds"] += scrubbed - start
+            stats["tokenize_seconds"] += time.perf_counter() - scrubbed
+        return items
 
     def chunk_generator(self):
         """
-        Iterate over the Dataset, yielding chunks of datapoints at a time
+        Iterate over the Dataset, yielding a parse task for each chunk of CHUNK_SIZE rows.
+        A task is a row range into the memory-mapped dataset cache, so no rows are copied
+        or pickled; the worker slices the Arrow table itself
         """
         size = len(self.dataset)
         for i in range(0, size, CHUNK_SIZE):
-            yield self.dataset.select(range(i, min(i + CHUNK_SIZE, size)))
+            stop = min(i + CHUNK_SIZE, size)
+            yield ParseTask(self.name, self.cache_files, i, stop, self.chunk_cache_path(i, stop), self.token_ids)
+
+    def chunk_cache_path(self, start, stop) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, self.name, self.cache_key, f"{start}-{stop}.pkl")
+
+    def chunk_count(self):
+        return math.ceil(len(self.dataset) / CHUNK_SIZE)
 
     def load_in_parallel(self, workers):
         """
         Use concurrent.futures to farm out the work to process chunks of datapoints -
         This speeds up processing significantly, but will tie up your computer while it's doing so!
+        The tokenizer is loaded once here and handed to each worker by the pool initializer
         """
-        results = []
-        chunk_count = (len(self.dataset) // CHUNK_SIZE) + 1
-        with ProcessPoolExecutor(max_workers=workers) as pool:
-            for batch in tqdm(pool.map(self.from_chunk, self.chunk_generator()), total=chunk_count):
-                results.extend(batch)
-        for result in results:
-            result.category = self.name
-        return results
-            
-    def load(self, workers=8):
+        chunks = {}
+        with make_pool(workers) as pool:
+            tasks = run_tasks(pool, self.chunk_generator(), workers * IN_FLIGHT_PER_WORKER)
+            for task, batch in tqdm(tasks, total=self.chunk_count()):
+                chunks[task.start] = batch
+        return self.assemble(chunks)
+
+    def assemble(self, chunks: Dict[int, ItemBatch]) -> List[Item]:
         """
-        Load in this dataset; the workers parameter specifies how many processes
-        should work on loading and scrubbing the data
+        Put parsed batches, keyed by their first row, back into dataset order as Items
+        """
+        return [item for first in sorted(chunks) for item in chunks[first].to_items()]
+
+    def open(self):
+        """
+        Open this dataset, downloading it into the Hugging Face cache if needed
         """
-        start = datetime.now()
         print(f"Loading dataset {self.name}", flush=True)
+        start = time.perf_counter()
         self.dataset = load_dataset("McAuley-Lab/Amazon-Reviews-2023", f"raw_meta_{self.name}", split="full", trust_remote_code=True)
-        results = self.load_in_parallel(workers)
+        self.cache_files = tuple(cache_file["filename"] for cache_file in self.dataset.cache_files)
+        if not self.cache_files:
+            raise ValueError(f"Dataset {self.name} has no Arrow cache files to memory-map")
+        key = [CACHE_VERSION, self.dataset._fingerprint, rules_fingerprint(), MIN_PRICE, MAX_PRICE, self.token_ids]
+        self.cache_key = hashlib.sha256(json.dumps(key).encode()).hexdigest()[:16]
+        self.open_seconds = time.perf_counter() - start
+        return self
+
+    def load(self, workers: Optional[int] = None):
+        """
+        Load in this dataset; the workers parameter specifies how many processes
+        should work on loading and scrubbing the data, defaulting to one per core
+        """
+        start = datetime.now()
+        self.open()
+        results = self.load_in_parallel(workers or default_workers())
         finish = datetime.now()
         print(f"Completed {self.name} with {len(results):,} datapoints in {(finish-start).total_seconds()/60:.1f} mins", flush=True)
         return results
@@ -0,0 +1,106 @@
+"""
+profiling.py
+
+Instrumentation for the curation pipeline. Records wall time, CPU time, peak RSS and rows in/out
+for each stage, and a breakdown of each category's load (dataset open, read, scrub, tokenization,
+queueing and result transfer back to the parent), then writes them to a JSON report that can be diffed between runs.
+"""
+
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+CHUNK_TIMINGS = ["worker_seconds", "read_seconds", "scrub_seconds", "tokenize_seconds", "queue_seconds", "transfer_seconds"]
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    return resource.getrusage(who).ru_maxrss * RSS_UNIT / 1e6
+
+
+def cpu_seconds(who: int) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Profiler:
+    """
+    Collects stage and per-category measurements for one curation run
+    """
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.stages = []
+        self.categories: Dict[str, dict] = {}
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None):
+        """
+        Measure the block as a stage. The record is yielded so the block can set rows_out.
+        CPU time includes worker processes that were reaped during the stage
+        """
+        record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+        wall = time.perf_counter()
+        cpu = cpu_seconds(resource.RUSAGE_SELF)
+        children_cpu = cpu_seconds(resource.RUSAGE_CHILDREN)
+        yield record
+        record["wall_seconds"] = time.perf_counter() - wall
+        record["cpu_seconds"] = cpu_seconds(resource.RUSAGE_SELF) - cpu
+        record["worker_cpu_seconds"] = cpu_seconds(resource.RUSAGE_CHILDREN) - children_cpu
+        record["peak_rss_mb"] = peak_rss_mb()
+        record["worker_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        self.stages.append(record)
+        print(f"[profile] {name}: {record['wall_seconds']:.1f}s wall, {record['cpu_seconds']:.1f}s cpu, "
+              f"{record['peak_rss_mb']:,.0f} MB peak", flush=True)
+
+    def category(self, name: str) -> dict:
+        if name not in self.categories:
+            self.categories[name] = {
+                "open_seconds": 0.0,
+                "chunks": 0,
+                "cached_chunks": 0,
+                "rows_in": 0,
+                "rows_out": 0,
+                "worker_peak_rss_mb": 0.0,
+                **{timing: 0.0 for timing in CHUNK_TIMINGS},
+            }
+        return self.categories[name]
+
+    def record_open(self, name: str, seconds: float):
+        self.category(name)["open_seconds"] += seconds
+
+    def record_chunk(self, name: str, rows_in: int, rows_out: int, stats: Optional[dict]):
+        """
+        Add one parsed chunk to its category. stats is None for chunks read from the parse cache
+        """
+        record = self.category(name)
+        record["chunks"] += 1
+        record["rows_in"] += rows_in
+        record["rows_out"] += rows_out
+        if stats is None:
+            record["cached_chunks"] += 1
+            return
+        for timing in ["read_seconds", "scrub_seconds", "tokenize_seconds"]:
+            record[timing] += stats[timing]
+        record["worker_peak_rss_mb"] = max(record["worker_peak_rss_mb"], stats["peak_rss_mb"])
+        record["worker_seconds"] += stats["finished_at"] - stats["started_at"]
+        record["queue_seconds"] += stats["started_at"] - stats["submitted_at"]
+        record["transfer_seconds"] += stats["received_at"] - stats["finished_at"]
+
+    def report(self) -> dict:
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "stages": self.stages,
+            "categories": self.categories,
+        }
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"✓ Saved profiling report to {path}")
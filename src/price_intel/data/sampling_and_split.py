@@ -2,51 +2,78 @@
 sampling_and_split.py
 
 Samples and splits items into train/test datasets and saves them to disk.
+Sampling works on NumPy arrays of rounded prices and category codes, and returns row indices
+into the loaded items rather than lists of Items.
 """
 
 import random
 import numpy as np
-import pickle
-from collections import defaultdict, Counter
-from typing import List, Tuple
+from collections import Counter
+from typing import Iterable, NamedTuple, Sequence, Tuple
 from price_intel.data.items import Item
+from price_intel.data.item_store import ItemStore
 
-def make_price_slots(items: List[Item]):
-    """Group items by rounded price."""
-    slots = defaultdict(list)
-    for item in items:
-        slots[round(item.price)].append(item)
-    return slots
+SLOT_SIZE = 1200  # Most items kept from any one price slot below FULL_SLOTS_FROM
+FULL_SLOTS_FROM = 240  # Every item priced at or above this is kept
+WEIGHTED_DOWN = "Automotive"  # Over-represented category, sampled at a fifth of the weight of the others
 
-def balanced_sample(slots: dict) -> List[Item]:
-    """Sample items to balance categories and prices."""
+
+class PriceSlots(NamedTuple):
+    """
+    Items as parallel arrays: the rounded price and category code of each row,
+    and the category names the codes refer to
+    """
+    prices: np.ndarray
+    categories: np.ndarray
+    names: Tuple[str, ...]
+
+
+def make_price_slots(items: Sequence[Item]) -> PriceSlots:
+    """Collect the rounded price and category of every item into arrays."""
+    codes = {}
+    prices = np.fromiter((round(item.price) for item in items), dtype=np.int64, count=len(items))
+    categories = np.fromiter((codes.setdefault(item.category, len(codes)) for item in items), dtype=np.int32, count=len(items))
+    return PriceSlots(prices, categories, tuple(codes))
+
+def balanced_sample(slots: PriceSlots) -> np.ndarray:
+    """
+    Sample items to balance categories and prices, returning their row indices.
+    Slots are visited in price order and the weighted draws are made with the same seed and the
+    same sequence of np.random.choice calls as before, so the sample is identical to the one
+    drawn from per-slot lists of Items
+    """
     np.random.seed(42)
     random.seed(42)
-    sample = []
+    order = np.argsort(slots.prices, kind="stable")
+    bounds = np.searchsorted(slots.prices[order], np.arange(1, 1001))
+    weighted_down = slots.names.index(WEIGHTED_DOWN) if WEIGHTED_DOWN in slots.names else -1
+    pieces = []
     for i in range(1, 1000):
-        slot = slots[i]
-        if i >= 240:
-            sample.extend(slot)
-        elif len(slot) <= 1200:
-            sample.extend(slot)
+        slot = order[bounds[i - 1]:bounds[i]]
+        if i >= FULL_SLOTS_FROM or len(slot) <= SLOT_SIZE:
+            pieces.append(slot)
         else:
-            weights = np.array([1 if item.category == "Automotive" else 5 for item in slot])
+            weights = np.where(slots.categories[slot] == weighted_down, 1, 5)
             weights = weights / np.sum(weights)
-            selected_indices = np.random.choice(len(slot), size=1200, replace=False, p=weights)
-            selected = [slot[idx] for idx in selected_indices]
-            sample.extend(selected)
+            selected_indices = np.random.choice(len(slot), size=SLOT_SIZE, replace=False, p=weights)
+            pieces.append(slot[selected_indices])
+    sample = np.concatenate(pieces) if pieces else np.empty(0, dtype=np.int64)
     print(f"✓ Created balanced sample of {len(sample):,} items.")
     return sample
 
-def summarize_categories(sample: List[Item]):
-    """Print a simple category distribution summary."""
-    counts = Counter(item.category for item in sample)
+def summarize_categories(slots: PriceSlots, sample: np.ndarray):
+    """Print a simple category distribution summary of the sampled rows."""
+    counts = Counter({slots.names[code]: int(count) for code, count in enumerate(np.bincount(slots.categories[sample], minlength=len(slots.names))) if count})
     for cat, count in counts.items():
         print(f"{cat:<30} {count:>8}")
     return counts
 
-def split_train_test(sample: List[Item], train_size: int = 400_000, test_size: int = 2_000):
-    """Split into train and test sets with reproducibility."""
+def split_train_test(sample: Sequence, train_size: int = 400_000, test_size: int = 2_000):
+    """
+    Split into train and test sets with reproducibility.
+    The sample may be Items or row indices; the shuffle depends only on its length
+    """
+    sample = list(sample)
     random.seed(42)
     random.shuffle(sample)
     train = sample[:train_size]
@@ -54,10 +81,8 @@ def split_train_test(sample: List[Item], train_size: int = 400_000, test_size: i
     print(f"✓ Split into {len(train):,} train / {len(test):,} test items.")
     return train, test
 
-def save_pickle(train: List[Item], test: List[Item], prefix: str = "data"):
-    """Save train/test splits as pickle files."""
-    with open(f"{prefix}_train.pkl", "wb") as f:
-        pickle.dump(train, f)
-    with open(f"{prefix}_test.pkl", "wb") as f:
-        pickle.dump(test, f)
-    print(f"✓ Saved {prefix}_train.pkl and {prefix}_test.pkl")
+def save_item_store(train: Iterable[Item], test: Iterable[Item], prefix: str = "data", token_ids: bool = False):
+    """Save train/test splits as columnar Arrow item stores, with packed token ids if token_ids is set."""
+    ItemStore.write(train, f"{prefix}_train.arrow", token_ids=token_ids)
+    ItemStore.write(test, f"{prefix}_test.arrow", token_ids=token_ids)
+    print(f"✓ Saved {prefix}_train.arrow and {prefix}_test.arrow")
@@ -1,32 +1,142 @@
-# imports
+"""
+upload_dataset_to_hf.py
 
-import pickle
-from datasets import Dataset, DatasetDict
-from price_intel.data.env_setup import setup_environment, login_huggingface
+Export the curated train and test splits as Parquet shards, then optionally push them to the Hugging Face Hub.
 
-setup_environment()
-login_huggingface()
+Shards are sliced straight from the memory-mapped ItemStore files, so peak memory is one shard
+however large the train split grows, and no Python objects are built per row. Each shard is
+written to a temporary file and renamed into place, so an interrupted export resumes from the
+first missing shard. The shards use the Hub's data/{split}-00000-of-00010.parquet layout, so the
+export can be checked offline with load_dataset("parquet", data_dir=...) and pushed as it is.
 
+    python -m price_intel.data.upload_dataset_to_hf [--out-dir pricer_data] [--shard-rows 100000] [--push]
+"""
 
-with open("amazon_items_train.pkl", "rb") as f:
-    train = pickle.load(f)
+import argparse
+import glob
+import json
+import math
+import os
+from typing import Dict
 
-with open("amazon_items_test.pkl", "rb") as f:
-    test = pickle.load(f)
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
-train_prompts = [item.prompt for item in train]
-train_prices = [item.price for item in train]
-test_prompts = [item.test_prompt() for item in test]
-test_prices = [item.price for item in test]
+from price_intel.data.item_store import ItemStore
+from price_intel.data.items import Item
 
-train_dataset = Dataset.from_dict({"text": train_prompts, "price": train_prices})
-test_dataset = Dataset.from_dict({"text": test_prompts, "price": test_prices})
+DATASET_NAME = "laureen-ai/pricer-data"
+SPLITS = {"train": "amazon_items_train.arrow", "test": "amazon_items_test.arrow"}
+EXPORT_DIR = "pricer_data"
+SHARD_ROWS = 100_000
 
-dataset = DatasetDict({
-    "train": train_dataset,
-    "test": test_dataset
-})
+SCHEMA = pa.schema([("text", pa.string()), ("price", pa.float64())])
+
+
+def to_export(table: pa.Table, split: str) -> pa.Table:
+    """
+    The exported columns for rows of a split: train keeps the full prompt as its text,
+    test has the price removed from it, as Item.test_prompt does
+    """
+    text = table.column("prompt")
+    if split == "test":
+        question = pc.list_element(pc.split_pattern(text, Item.PREFIX, max_splits=1), 0)
+        text = pc.binary_join_element_wise(question, Item.PREFIX, "")
+    return pa.Table.from_arrays([text, table.column("price")], schema=SCHEMA)
+
+
+def shard_path(out_dir: str, split: str, index: int, total: int) -> str:
+    return os.path.join(out_dir, "data", f"{split}-{index:05d}-of-{total:05d}.parquet")
+
+
+def source_signature(path: str, rows: int, shard_rows: int) -> Dict:
+    """
+    What the shards of a split were cut from; a resumed export only keeps shards with the same signature
+    """
+    stat = os.stat(path)
+    return {"source": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime, "rows": rows, "shard_rows": shard_rows}
+
+
+def export_split(store: ItemStore, out_dir: str, split: str, shard_rows: int = SHARD_ROWS) -> int:
+    """
+    Write one split as Parquet shards of shard_rows rows, skipping shards already written by an
+    earlier run from the same source. Return the number of shards
+    """
+    table = store.table(["prompt", "price"])
+    total = max(1, math.ceil(table.num_rows / shard_rows))
+    manifest_path = os.path.join(out_dir, f"{split}.json")
+    signature = source_signature(store.path, table.num_rows, shard_rows)
+    os.makedirs(os.path.join(out_dir, "data"), exist_ok=True)
+
+    previous = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+    if previous != signature:
+        for stale in glob.glob(os.path.join(out_dir, "data", f"{split}-*.parquet*")):
+            os.remove(stale)
+        with open(manifest_path, "w") as f:
+            json.dump(signature, f, indent=2)
+
+    written = 0
+    for index in range(total):
+        path = shard_path(out_dir, split, index, total)
+        if os.path.exists(path):
+            continue
+        shard = to_export(table.slice(index * shard_rows, shard_rows), split)
+        temp_path = f"{path}.tmp"
+        pq.write_table(shard, temp_path)
+        os.replace(temp_path, path)
+        written += 1
+    print(f"✓ Exported {split}: {table.num_rows:,} rows in {total} shards ({written} written, {total - written} already there)")
+    return total
+
+
+def export_dataset(out_dir: str = EXPORT_DIR, shard_rows: int = SHARD_ROWS, splits: Dict[str, str] = SPLITS):
+    """
+    Export every split to out_dir
+    """
+    for split, path in splits.items():
+        export_split(ItemStore(path), out_dir, split, shard_rows)
+
+
+def push_dataset(out_dir: str = EXPORT_DIR, dataset_name: str = DATASET_NAME, private: bool = True, splits: Dict[str, str] = SPLITS):
+    """
+    Upload the exported shards to a dataset repo on the Hugging Face Hub, in the same commit
+    deleting the shards of these splits that are already there. upload_folder only adds files,
+    and leftovers of an earlier push or another --shard-rows would match the same data/{split}-*
+    pattern and double the split
+    """
+    from huggingface_hub import HfApi
+    from price_intel.data.env_setup import setup_environment, login_huggingface
+
+    setup_environment()
+    login_huggingface()
+    api = HfApi()
+    api.create_repo(dataset_name, repo_type="dataset", private=private, exist_ok=True)
+    api.upload_folder(
+        repo_id=dataset_name,
+        repo_type="dataset",
+        folder_path=out_dir,
+        allow_patterns=["data/*.parquet"],
+        delete_patterns=[f"data/{split}-*.parquet" for split in splits],
+    )
+    print(f"✓ Pushed {out_dir} to {dataset_name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out-dir", default=EXPORT_DIR)
+    parser.add_argument("--shard-rows", type=int, default=SHARD_ROWS)
+    parser.add_argument("--push", action="store_true", help="push the shards to the Hub once exported")
+    parser.add_argument("--dataset-name", default=DATASET_NAME)
+    args = parser.parse_args()
+
+    export_dataset(args.out_dir, args.shard_rows)
+    if args.push:
+        push_dataset(args.out_dir, args.dataset_name)
 
-DATASET_NAME = "laureen-ai/pricer-data"
-dataset.push_to_hub(DATASET_NAME, private = True)
 
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,6 @@ Train the linear regression ensemble model that combines:
 and save it as `ensemble_model.pkl`.
 """
 
-import pickle
 from typing import List
 
 import numpy as np
@@ -17,9 +16,9 @@ import pandas as pd
 import joblib
 from sklearn.linear_model import LinearRegression
 import chromadb
-from tqdm import tqdm
 
 from price_intel.data.items import Item
+from price_intel.data.item_store import ItemStore
 from price_intel.agents.specialist_agent import SpecialistAgent
 from price_intel.agents.frontier_agent import FrontierAgent
 from price_intel.agents.random_forest_agent import RandomForestAgent
@@ -27,7 +26,7 @@ from price_intel.agents.random_forest_agent import RandomForestAgent
 
 DB_PATH = "products_vectorstore"
 COLLECTION_NAME = "products"
-TEST_PKL_PATH = "amazon_items_test.pkl"
+TEST_STORE_PATH = "amazon_items_test.arrow"
 ENSEMBLE_MODEL_PATH = "ensemble_model.pkl"
 
 
@@ -35,6 +34,8 @@ def description_from_item(item: Item) -> str:
     """
     Extract description from the Item
     """
+    if getattr(item, "description", None) is not None:
+        return item.description
 
     text = item.prompt.split("to the nearest dollar?\n\n", 1)[-1]
     text = text.split("\n\nPrice is $", 1)[0]
@@ -42,15 +43,14 @@ def description_from_item(item: Item) -> str:
 
 
 def load_test_items(path: str) -> List[Item]:
-    with open(path, "rb") as f:
-        items = pickle.load(f)
+    items = ItemStore(path).items(columns=["description", "price"])
     print(f"Loaded {len(items):,} test items from {path}")
     return items
 
 
 def main():
     # 1. Load test items
-    test_items = load_test_items(TEST_PKL_PATH)
+    test_items = load_test_items(TEST_STORE_PATH)
 
     # 2. Connect to Chroma for FrontierAgent
     client = chromadb.PersistentClient(path=DB_PATH)
@@ -61,22 +61,15 @@ def main():
     frontier = FrontierAgent(collection)
     random_forest = RandomForestAgent()
 
-    specialists = []
-    frontiers = []
-    random_forests = []
-    prices = []
-
     eval_slice = test_items[1000:1250]
 
-    for item in tqdm(eval_slice, desc="Collecting ensemble training data"):
-        text = description_from_item(item)
-        s = specialist.price(text)
-        f = frontier.price(text)
-        r = random_forest.price(text)
-        specialists.append(s)
-        frontiers.append(f)
-        random_forests.append(r)
-        prices.append(item.price)
+    # 4. Price the slice with each agent's batch form, embedding it once for the frontier and random forest agents
+    texts = [description_from_item(item) for item in eval_slice]
+    vectors = frontier.encoder.encode(texts)
+    specialists = specialist.price_batch(texts)
+    frontiers = frontier.price_batch(texts, vectors=vectors)
+    random_forests = random_forest.price_batch(texts, vectors=vectors)
+    prices = [item.price for item in eval_slice]
 
     mins = [min(s, f, r) for s, f, r in zip(specialists, frontiers, random_forests)]
     maxes = [max(s, f, r) for s, f, r in zip(specialists, frontiers, random_forests)]
@@ -92,7 +85,7 @@ def main():
     )
     y = pd.Series(prices)
 
-    # 4. Train linear regression
+    # 5. Train linear regression
     np.random.seed(42)
     lr = LinearRegression()
     lr.fit(X, y)
@@ -3,29 +3,49 @@ train_random_forest.py
 
 Train a RandomForestRegressor on Chroma embeddings and prices,
 then save it as `random_forest_model.pkl`.
+
+The embeddings are read a page at a time into one preallocated float32 matrix,
+which is the dtype the forest trains on anyway.
 """
 
+import time
 from pathlib import Path
 import numpy as np
 import joblib
 from sklearn.ensemble import RandomForestRegressor
 import chromadb
 
+from price_intel.data.profiling import peak_rss_mb
+
 
 DB_PATH = "products_vectorstore"
 COLLECTION_NAME = "products"
 MODEL_PATH = "src/price_intel/models/random_forest_model.pkl"
+PAGE_SIZE = 10_000
 
 
-def load_chroma_vectors(db_path: str, collection_name: str):
+def load_chroma_vectors(db_path: str, collection_name: str, page_size: int = PAGE_SIZE):
     client = chromadb.PersistentClient(path=db_path)
     collection = client.get_or_create_collection(collection_name)
 
-    result = collection.get(include=["embeddings", "metadatas"])
-    embeddings = np.array(result["embeddings"], dtype=float)
-    prices = np.array([m["price"] for m in result["metadatas"]], dtype=float)
+    start = time.perf_counter()
+    count = collection.count()
+    embeddings = None
+    prices = np.empty(count, dtype=float)
+    for offset in range(0, count, page_size):
+        result = collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+        page = np.asarray(result["embeddings"], dtype=np.float32)
+        if embeddings is None:
+            embeddings = np.empty((count, page.shape[1]), dtype=np.float32)
+        embeddings[offset : offset + len(page)] = page
+        prices[offset : offset + len(page)] = [m["price"] for m in result["metadatas"]]
+    if embeddings is None:
+        embeddings = np.empty((0, 0), dtype=np.float32)
 
-    print(f"Loaded {embeddings.shape[0]:,} embeddings from Chroma.")
+    print(
+        f"Loaded {embeddings.shape[0]:,} embeddings from Chroma in {time.perf_counter() - start:.1f}s "
+        f"({embeddings.nbytes / 1024**2:,.0f} MB as float32, peak RSS {peak_rss_mb():,.0f} MB)."
+    )
     return embeddings, prices
 
 
@@ -0,0 +1,41 @@
+"""
+build_index.py
+Copies the Chroma vectorstore into an in-process index for the agents' neighbour lookups.
+
+    python -m price_intel.vectorstore.build_index [--nlist N] [--quantize int8 float16] [--shards [--workers N]] [--out products_index]
+
+--nlist sets the number of IVF lists, defaulting to about the square root of the row count;
+--nlist 0 builds an exact-search-only index. --quantize adds compact copies of the vectors,
+and the agents search the first one, re-ranking its candidates at full precision.
+--shards builds one index per category, --workers of them in parallel.
+"""
+
+import argparse
+
+import chromadb
+
+from price_intel.data.aggregate_items import DATASET_NAMES
+from price_intel.vectorstore.vector_index import INDEX_PATH, build_matrix_index, build_sharded_index
+
+DB_PATH = "products_vectorstore"
+COLLECTION_NAME = "products"
+
+
+def main(out: str = INDEX_PATH, nlist=None, quantized=(), shards: bool = False, workers: int = 1):
+    if shards:
+        build_sharded_index(DB_PATH, COLLECTION_NAME, DATASET_NAMES, out, nlist=nlist, quantized=quantized, workers=workers)
+        return
+    client = chromadb.PersistentClient(path=DB_PATH)
+    collection = client.get_collection(COLLECTION_NAME)
+    build_matrix_index(collection, out, nlist=nlist, quantized=quantized)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=INDEX_PATH)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists to cluster the vectors into")
+    parser.add_argument("--quantize", nargs="*", default=[], choices=["int8", "float16"], help="compact copies of the vectors to add")
+    parser.add_argument("--shards", action="store_true", help="build one index per category")
+    parser.add_argument("--workers", type=int, default=1, help="shards to build at once")
+    args = parser.parse_args()
+    main(args.out, args.nlist, args.quantize, args.shards, args.workers)
@@ -1,20 +1,26 @@
 """
 build_vectorstore.py
-Orchestrates loading pickled items and building the Chroma vectorstore.
+Orchestrates loading curated items and building the Chroma vectorstore.
+
+    python -m price_intel.vectorstore.build_vectorstore [--embed-workers N] [--incremental | --resume]
+
+With --embed-workers the descriptions are embedded by N CPU worker processes.
+With --incremental the existing collection is synced to the training items instead of rebuilt.
+With --resume a full build that died partway continues from its last committed write.
 """
 
-import pickle
+import argparse
 
 from price_intel.data.env_setup import setup_environment, login_huggingface
+from price_intel.data.item_store import ItemStore
 from price_intel.vectorstore.chroma_builder import ChromaBuilder
 
-def load_train_items(path: str = "amazon_items_train.pkl"):
-    with open(path, "rb") as f:
-        items = pickle.load(f)
+def load_train_items(path: str = "amazon_items_train.arrow"):
+    items = ItemStore(path).items(columns=["description", "price", "category"])
     print(f"Loaded {len(items):,} training items from {path}")
     return items
 
-def main():
+def main(embed_workers: int = 1, incremental: bool = False, resume: bool = False):
     setup_environment()
     login_huggingface()
 
@@ -24,8 +30,16 @@ def main():
         db_path="products_vectorstore",
         collection_name="products"
     )
-    builder.reset_collection()
-    builder.ingest_items(items)
+    if incremental:
+        builder.sync_items(items, embed_workers=embed_workers)
+    else:
+        builder.build(items, embed_workers=embed_workers, resume=resume)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embed-workers", type=int, default=1, help="CPU worker processes to embed with")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--incremental", action="store_true", help="sync the existing collection instead of rebuilding it")
+    mode.add_argument("--resume", action="store_true", help="continue an interrupted build from its checkpoint")
+    args = parser.parse_args()
+    main(args.embed_workers, args.incremental, args.resume)
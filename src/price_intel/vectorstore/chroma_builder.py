@@ -1,15 +1,110 @@
 """
 chroma_builder.py
 Handles creation, deletion, and population of a Chroma vectorstore.
+
+Ingestion is a three-stage pipeline - describe, embed, write - with each stage in its own thread
+and bounded queues between them, so embedding and Chroma writes overlap and a build runs at the
+pace of its slowest stage. Embeddings stay float32 NumPy arrays all the way into collection.upsert.
+
+Each row's id is a hash of its item's category and description, so the same item keeps its id
+across builds. sync_items uses that to refresh an existing collection in place: only new items
+are embedded, items whose metadata changed are updated, and items no longer present are deleted.
+
+A full build records a checkpoint next to the database after every write: a fingerprint of the
+items' ids and how many of them are committed. Writes land in item order, so a build that died
+partway can resume after the last committed write instead of starting over.
 """
 
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
 import chromadb
+import numpy as np
 from tqdm import tqdm
-from typing import List
+from typing import Dict, List, Optional
 
 from price_intel.vectorstore.description import extract_description
 from price_intel.vectorstore.embedder import Embedder
+from price_intel.vectorstore.embedding_cache import open_cache
 from price_intel.data.items import Item
+from price_intel.data.profiling import peak_rss_mb
+
+EMBED_BATCH_SIZE = 1000
+WRITE_BATCH_SIZE = 5000
+QUEUE_DEPTH = 4  # Batches buffered between two stages
+READ_PAGE_SIZE = 10_000  # Rows read at a time when diffing against an existing collection
+
+# Marks the end of a stage's output
+DONE = object()
+
+
+class Stage:
+    """
+    The items handled by one pipeline stage, and the seconds it spent busy on them
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.seconds = 0.0
+
+    def record(self, items: int, started: float):
+        self.items += items
+        self.seconds += time.perf_counter() - started
+
+    @property
+    def rate(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+
+class StageFailed(Exception):
+    """
+    Raised in a stage when another stage of the pipeline has failed
+    """
+
+
+def item_ids(items: List[Item]) -> List[str]:
+    """
+    A stable id for each item: the hash of its category and description.
+    Repeats of the same content get their occurrence number appended, so ids stay unique
+    """
+    ids = []
+    seen: Dict[str, int] = {}
+    for item in items:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update((item.category or "").encode())
+        digest.update(b"\0")
+        digest.update(extract_description(item).encode())
+        key = digest.hexdigest()
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        ids.append(key if occurrence == 0 else f"{key}-{occurrence}")
+    return ids
+
+
+def item_metadata(item: Item) -> Dict[str, object]:
+    return {"category": item.category, "price": item.price}
+
+
+def ids_fingerprint(ids: List[str]) -> str:
+    """
+    A hash of these ids in order, identifying the items a checkpoint was written for
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for item_id in ids:
+        digest.update(item_id.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class CheckpointMismatch(Exception):
+    """
+    Raised when a build can't resume, because the checkpoint doesn't match the items or the collection
+    """
+
 
 class ChromaBuilder:
     def __init__(self, db_path: str = "products_vectorstore", collection_name: str = "products"):
@@ -25,25 +120,241 @@ class ChromaBuilder:
         self.collection = self.client.create_collection(self.collection_name)
         print(f"Created new collection: {self.collection_name}")
 
-    def ingest_items(self, items: List[Item], batch_size: int = 1000):
-        embedder = Embedder()
+    def open_collection(self):
+        self.collection = self.client.get_or_create_collection(self.collection_name)
+        print(f"Opened collection: {self.collection_name} ({self.collection.count():,} documents)")
 
-        total = len(items)
-        print(f"Ingesting {total:,} documents into Chroma...")
+    @property
+    def checkpoint_path(self) -> str:
+        return os.path.join(self.db_path, f"{self.collection_name}.checkpoint.json")
 
-        for start in tqdm(range(0, total, batch_size)):
-            batch = items[start : start + batch_size]
+    def read_checkpoint(self) -> Optional[dict]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
 
-            documents = [extract_description(item) for item in batch]
-            vectors = embedder.encode_batch(documents)
-            metadatas = [{"category": item.category, "price": item.price} for item in batch]
-            ids = [f"doc_{i}" for i in range(start, start + len(batch))]
+    def write_checkpoint(self, fingerprint: str, total: int, committed: int):
+        """
+        Record that the first committed of these total items are in the collection,
+        writing to a temporary file first so an interrupted run never leaves a partial checkpoint
+        """
+        checkpoint = {"collection": self.collection_name, "fingerprint": fingerprint, "total": total, "committed": committed}
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
 
-            self.collection.add(
-                ids=ids,
-                documents=documents,
-                embeddings=vectors,
-                metadatas=metadatas
+    def resume_point(self, ids: List[str]) -> int:
+        """
+        Return how many of the items with these ids a previous build committed, checking the checkpoint
+        was written for the same items and that the collection holds exactly those rows.
+        A write that landed after its checkpoint was saved is counted as committed
+        """
+        checkpoint = self.read_checkpoint()
+        if checkpoint is None:
+            print("No checkpoint to resume from, starting a fresh build")
+            return 0
+        if checkpoint["fingerprint"] != ids_fingerprint(ids):
+            raise CheckpointMismatch(f"Checkpoint at {self.checkpoint_path} was written for a different set of items")
+        committed = checkpoint["committed"]
+        self.open_collection()
+        count = self.collection.count()
+        unrecorded = ids[committed:count]
+        if 0 < len(unrecorded) <= self.client.get_max_batch_size():
+            if len(self.collection.get(ids=unrecorded, include=[])["ids"]) == len(unrecorded):
+                committed = count
+        if count != committed:
+            raise CheckpointMismatch(
+                f"Checkpoint records {committed:,} committed items but the collection holds {count:,}; rebuild without resuming"
             )
+        print(f"Resuming from checkpoint: {committed:,} of {len(ids):,} items already committed")
+        return committed
+
+    def build(self, items: List[Item], embed_workers: int = 1, resume: bool = False) -> Dict[str, float]:
+        """
+        Build the collection from these items, checkpointing each write.
+        With resume, continue a previous build of the same items from its checkpoint instead of
+        resetting the collection. Return the items/sec of each ingestion stage
+        """
+        ids = item_ids(items)
+        fingerprint = ids_fingerprint(ids)
+        committed = self.resume_point(ids) if resume else 0
+        if committed == 0:
+            self.reset_collection()
+            self.write_checkpoint(fingerprint, len(ids), 0)
+        if committed == len(ids):
+            print(f"✓ Build already complete: {committed:,} documents.")
+            return {}
+        return self.ingest_items(items, ids=ids, resume_from=committed, fingerprint=fingerprint, embed_workers=embed_workers)
+
+    def existing_metadata(self, page_size: int = READ_PAGE_SIZE) -> Dict[str, dict]:
+        """
+        Return the metadata of every row in the collection, keyed by id, reading a page at a time
+        """
+        existing = {}
+        for offset in range(0, self.collection.count(), page_size):
+            result = self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            existing.update(zip(result["ids"], result["metadatas"]))
+        return existing
+
+    def sync_items(self, items: List[Item], embed_workers: int = 1) -> Dict[str, int]:
+        """
+        Bring the collection in line with these items without rebuilding it:
+        embed and upsert the new ones, update the metadata of changed ones and delete the ones
+        that are gone. Return how many items were added, updated, deleted and left unchanged
+        """
+        self.open_collection()
+        started_at = time.perf_counter()
+        existing = self.existing_metadata()
+        ids = item_ids(items)
+        wanted = set(ids)
+
+        added, changed = [], []
+        for i, (item_id, item) in enumerate(zip(ids, items)):
+            metadata = existing.get(item_id)
+            if metadata is None:
+                added.append(i)
+            elif metadata != item_metadata(item):
+                changed.append(i)
+        removed = [item_id for item_id in existing if item_id not in wanted]
+        counts = {"added": len(added), "updated": len(changed), "deleted": len(removed)}
+        counts["unchanged"] = len(items) - counts["added"] - counts["updated"]
+        print(", ".join(f"{count:,} {name}" for name, count in counts.items()))
+
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(removed), batch_size):
+            self.collection.delete(ids=removed[start : start + batch_size])
+        for start in range(0, len(changed), batch_size):
+            batch = changed[start : start + batch_size]
+            self.collection.update(ids=[ids[i] for i in batch], metadatas=[item_metadata(items[i]) for i in batch])
+        if added:
+            self.ingest_items([items[i] for i in added], ids=[ids[i] for i in added], embed_workers=embed_workers)
+
+        print(f"✓ Sync complete in {time.perf_counter() - started_at:.1f}s: {self.collection.count():,} documents.")
+        return counts
+
+    def ingest_items(
+        self,
+        items: List[Item],
+        ids: Optional[List[str]] = None,
+        embed_batch_size: int = EMBED_BATCH_SIZE,
+        write_batch_size: int = WRITE_BATCH_SIZE,
+        embed_workers: int = 1,
+        resume_from: int = 0,
+        fingerprint: Optional[str] = None,
+    ) -> Dict[str, float]:
+        """
+        Describe, embed and write these items to the collection, as a pipeline of three threads.
+        Embedding runs embed_batch_size items at a time, and Chroma writes write_batch_size at a time
+        (capped at the most the client accepts). With embed_workers > 1, embedding is spread over
+        that many CPU worker processes. Rows are upserted under the given ids, defaulting to item_ids.
+        Items before resume_from are skipped, and with a fingerprint of the ids a checkpoint is
+        written after every write. Return the items/sec of each stage while busy
+        """
+        ids = ids if ids is not None else item_ids(items)
+        embedder = Embedder(cache=open_cache(Embedder.DEFAULT_MODEL), workers=embed_workers)
+        write_batch_size = min(write_batch_size, self.client.get_max_batch_size())
+        stages = {name: Stage(name) for name in ("describe", "embed", "write")}
+        described = queue.Queue(maxsize=QUEUE_DEPTH)
+        embedded = queue.Queue(maxsize=QUEUE_DEPTH)
+        failed = threading.Event()
+        errors = []
+
+        total = len(items)
+        print(f"Ingesting {total - resume_from:,} documents into Chroma...")
+
+        def put(outbox: queue.Queue, value):
+            while True:
+                try:
+                    outbox.put(value, timeout=0.1)
+                    return
+                except queue.Full:
+                    if failed.is_set():
+                        raise StageFailed()
+
+        def get(inbox: queue.Queue):
+            while True:
+                try:
+                    return inbox.get(timeout=0.1)
+                except queue.Empty:
+                    if failed.is_set():
+                        raise StageFailed()
+
+        def run(work, outbox: queue.Queue):
+            try:
+                work()
+                put(outbox, DONE)
+            except StageFailed:
+                pass
+            except BaseException as error:
+                errors.append(error)
+                failed.set()
+
+        def describe():
+            for start in range(resume_from, total, embed_batch_size):
+                batch = items[start : start + embed_batch_size]
+                started = time.perf_counter()
+                documents = [extract_description(item) for item in batch]
+                metadatas = [item_metadata(item) for item in batch]
+                stages["describe"].record(len(batch), started)
+                put(described, (start, documents, metadatas))
+
+        def embed():
+            while (batch := get(described)) is not DONE:
+                start, documents, metadatas = batch
+                started = time.perf_counter()
+                vectors = embedder.encode(documents)
+                stages["embed"].record(len(documents), started)
+                put(embedded, (start, documents, vectors, metadatas))
+
+        threads = [
+            threading.Thread(target=run, args=(describe, described), name="describe", daemon=True),
+            threading.Thread(target=run, args=(embed, embedded), name="embed", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        started_at = time.perf_counter()
+        # Embeddings are pending as rows of the float32 batches, and stacked into one matrix per write
+        pending = {"ids": [], "documents": [], "embeddings": [], "metadatas": []}
+        committed = resume_from
+        try:
+            with tqdm(total=total, initial=resume_from) as progress:
+                while True:
+                    batch = get(embedded)
+                    if batch is not DONE:
+                        start, documents, vectors, metadatas = batch
+                        pending["ids"] += ids[start : start + len(documents)]
+                        pending["documents"] += documents
+                        pending["embeddings"] += list(vectors)
+                        pending["metadatas"] += metadatas
+                    while len(pending["ids"]) >= write_batch_size or (batch is DONE and pending["ids"]):
+                        chunk = {key: values[:write_batch_size] for key, values in pending.items()}
+                        pending = {key: values[write_batch_size:] for key, values in pending.items()}
+                        chunk["embeddings"] = np.stack(chunk["embeddings"])
+                        started = time.perf_counter()
+                        self.collection.upsert(**chunk)
+                        stages["write"].record(len(chunk["ids"]), started)
+                        committed += len(chunk["ids"])
+                        if fingerprint is not None:
+                            self.write_checkpoint(fingerprint, total, committed)
+                        progress.update(len(chunk["ids"]))
+                    if batch is DONE:
+                        break
+        except StageFailed:
+            raise errors[0]
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+            embedder.cache.flush()
+            embedder.close()
 
-        print("✓ Ingestion complete.")
+        elapsed = time.perf_counter() - started_at
+        for stage in stages.values():
+            print(f"  {stage.name:<8} {stage.items:>9,} items in {stage.seconds:7.1f}s busy  {stage.rate:>9,.0f} items/sec")
+        print(f"✓ Ingestion complete: {(total - resume_from) / elapsed if elapsed else 0:,.0f} items/sec overall, peak RSS {peak_rss_mb():,.0f} MB.")
+        return {name: stage.rate for name, stage in stages.items()}
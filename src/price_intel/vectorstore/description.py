@@ -9,7 +9,11 @@ def extract_description(item: Item) -> str:
     """
     Remove the question and the price answer from the prompt,
     leaving only the item description text.
+    Items read from an ItemStore already carry the description.
     """
+    description = getattr(item, "description", None)
+    if description is not None:
+        return description
     text = item.prompt.replace(
         "How much does this cost to the nearest dollar?\n\n", ""
     )
@@ -1,16 +1,143 @@
 """
 embedder.py
-Loads a SentenceTransformer model and runs embedding inference.
+Loads a SentenceTransformer model and runs embedding inference,
+reading through an EmbeddingCache when one is given.
+
+The agents share one Embedder per model, through shared_embedder, so each model is loaded
+once per process however many agents embed with it.
+
+With workers > 1 the model runs on the CPU in a pool of worker processes instead, each with its
+own copy of the model and its own share of the cores. Texts are sorted by length and handed out
+in batches, so each batch pads to a similar length, and the vectors come back in input order.
 """
 
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import List
+import torch
+from typing import Dict, List, Optional
+
+from price_intel.cores import default_workers
+from price_intel.vectorstore.embedding_cache import EmbeddingCache, normalize, open_cache
+
+# Texts per batch handed to a worker process
+WORKER_BATCH_SIZE = 256
+
+# The model loaded by this worker process
+_worker_model: Optional[SentenceTransformer] = None
+
+# Embedders shared by this process's agents, keyed by model name
+_embedders: Dict[str, "Embedder"] = {}
+
+
+def init_worker(model_name: str, threads: int):
+    """
+    Pool initializer: pin this worker's torch threads and load its copy of the model
+    """
+    global _worker_model
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def encode_in_worker(texts: List[str]) -> np.ndarray:
+    """
+    Worker entry point: embed a batch of texts with this worker's model
+    """
+    return np.asarray(_worker_model.encode(texts, batch_size=len(texts)), dtype=np.float32)
+
 
 class Embedder:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+
+    DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        cache: Optional[EmbeddingCache] = None,
+        device: Optional[str] = None,
+        workers: int = 1,
+        threads_per_worker: Optional[int] = None,
+    ):
+        """
+        :param model_name: the SentenceTransformer model to embed with
+        :param cache: a cache of this model's embeddings to read through, or None to always run the model
+        :param device: where to run the model, defaulting to CUDA if it's available; ignored with several workers
+        :param workers: how many CPU worker processes to embed with, or 1 or fewer to run the model in this process
+        :param threads_per_worker: torch threads for each worker, defaulting to an even share of the cores
+        """
+        self.model_name = model_name
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(1, default_workers() // self.workers)
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.model = None
+        if self.workers == 1:
+            device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+            self.model = SentenceTransformer(model_name, device=device)
+
+    def run_model(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed these texts with the model, in this process or across the worker pool
+        """
+        if self.model is not None:
+            return np.asarray(self.model.encode(texts), dtype=np.float32)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if self.pool is None:
+            # Spawned rather than forked, so no worker inherits the parent's torch thread state
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(self.model_name, self.threads_per_worker),
+            )
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [order[start : start + WORKER_BATCH_SIZE] for start in range(0, len(order), WORKER_BATCH_SIZE)]
+        results = self.pool.map(encode_in_worker, [[texts[i] for i in batch] for batch in batches])
+        vectors = None
+        for batch, fresh in zip(batches, results):
+            if vectors is None:
+                vectors = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+            vectors[batch] = fresh
+        return vectors
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Return the embeddings of these texts as a float32 matrix.
+        Cached texts skip the model; the rest are embedded in one batch and added to the cache
+        """
+        if self.cache is None:
+            return self.run_model(texts)
+        vectors, missing = self.cache.lookup(texts)
+        if missing:
+            fresh = self.run_model([normalize(texts[i]) for i in missing])
+            self.cache.store([texts[i] for i in missing], fresh)
+            if vectors is None:
+                vectors = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+            vectors[missing] = fresh
+        return vectors
 
     def encode_batch(self, texts: List[str]) -> List[List[float]]:
-        vectors = self.model.encode(texts)
-        return np.asarray(vectors, dtype=float).tolist()
+        """
+        Return the embeddings of these texts as lists of Python floats, for backends that can't take arrays
+        """
+        return self.encode(texts).tolist()
+
+    def close(self):
+        """
+        Shut down the worker pool, if one was started
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+def shared_embedder(model_name: str = Embedder.DEFAULT_MODEL) -> Embedder:
+    """
+    Return this process's shared Embedder of a model, reading through its embedding cache,
+    loading the model the first time
+    """
+    if model_name not in _embedders:
+        _embedders[model_name] = Embedder(model_name, cache=open_cache(model_name))
+    return _embedders[model_name]
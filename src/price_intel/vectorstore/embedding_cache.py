@@ -0,0 +1,256 @@
+"""
+embedding_cache.py
+A persistent cache of text embeddings, shared by the vectorstore builder and the agents.
+
+Each model gets a directory holding a memory-mapped float32 matrix with one vector per row,
+and two parallel arrays: the 16-byte blake2b key of each row's model name and normalized text,
+and the tick at which the row was last used. The key -> row index is rebuilt in memory when the
+cache is opened. Once the matrix reaches its size cap, the least recently used rows are reused.
+
+Processes sharing a cache directory go through a lock file: writers take it exclusively and
+readers shared, so a lookup never sees a row half rewritten by another process. Both catch up
+with the rows other processes have added, whenever meta.json has changed, before going on.
+A row another process has since evicted or reused is caught on lookup, by checking the key
+stored with it. Within a process, use open_cache so that every Embedder of a model shares the
+same instance.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = "embedding_cache"
+MAX_BYTES = 2 * 1024**3  # Size cap of the vector matrix: about 1.4M MiniLM embeddings
+INITIAL_ROWS = 4096
+KEY_BYTES = 16
+
+# Caches opened by this process, keyed by model name and directory
+_caches: Dict[Tuple[str, str], "EmbeddingCache"] = {}
+
+
+def normalize(text: str) -> str:
+    """
+    Collapse runs of whitespace, which the sentence-transformers tokenizers ignore anyway
+    """
+    return " ".join(text.split())
+
+
+def open_cache(model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR, max_bytes: int = MAX_BYTES) -> "EmbeddingCache":
+    """
+    Return this process's cache for a model, opening it the first time
+    """
+    key = (model_name, os.path.abspath(cache_dir))
+    if key not in _caches:
+        _caches[key] = EmbeddingCache(model_name, cache_dir, max_bytes)
+    return _caches[key]
+
+
+class EmbeddingCache:
+
+    def __init__(self, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR, max_bytes: int = MAX_BYTES):
+        """
+        :param model_name: the embedding model whose vectors are cached
+        :param cache_dir: the directory holding a sub-directory per model
+        :param max_bytes: the size cap of the vector matrix, beyond which least recently used rows are evicted
+        """
+        self.model_name = model_name
+        self.path = os.path.join(cache_dir, model_name.replace("/", "__"))
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.dim: Optional[int] = None
+        self.size = 0
+        self.capacity = 0
+        self.tick = 0
+        self.rows: Dict[bytes, int] = {}
+        self.meta_version: Optional[Tuple[int, int]] = None  # The inode and mtime of the meta.json last read or written
+        self._refresh()
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    @property
+    def max_rows(self) -> int:
+        return max(1, self.max_bytes // (self.dim * 4))
+
+    def key(self, text: str) -> bytes:
+        digest = hashlib.blake2b(digest_size=KEY_BYTES)
+        digest.update(self.model_name.encode())
+        digest.update(b"\0")
+        digest.update(normalize(text).encode())
+        return digest.digest()
+
+    def find(self, key: bytes) -> Optional[int]:
+        """
+        Return the row holding this key, or None. A row that another process has evicted or reused
+        since it was indexed no longer holds the key, and is dropped from the index
+        """
+        row = self.rows.get(key)
+        if row is not None and self.keys[row].tobytes() != key:
+            del self.rows[key]
+            row = None
+        return row
+
+    def lookup(self, texts: Sequence[str]) -> Tuple[Optional[np.ndarray], List[int]]:
+        """
+        Return a float32 matrix with the cached vector of each text, and the positions of the texts
+        that weren't cached, whose rows are left unset. The matrix is None while the cache is empty
+        """
+        keys = [self.key(text) for text in texts]
+        if self.dim is None and not os.path.exists(self.meta_path):
+            return None, list(range(len(texts)))
+        with self.lock, self.file_lock(shared=True):
+            self._refresh()
+            if self.dim is None:
+                return None, list(range(len(texts)))
+            self.tick += 1
+            rows = [self.find(key) for key in keys]
+            hits = [i for i, row in enumerate(rows) if row is not None]
+            vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+            if hits:
+                found = np.array([rows[i] for i in hits])
+                vectors[hits] = self.vectors[found]
+                self.ticks[found] = self.tick
+        return vectors, [i for i, row in enumerate(rows) if row is None]
+
+    def store(self, texts: Sequence[str], vectors: np.ndarray):
+        """
+        Cache the vectors of these texts, evicting the least recently used rows if the cache is full
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock, self.file_lock():
+            self._refresh()
+            if self.dim is None:
+                self._create(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Vectors of dimension {vectors.shape[1]} don't fit a cache of dimension {self.dim}")
+            self.tick += 1
+            new = {}
+            for i, text in enumerate(texts):
+                key = self.key(text)
+                if self.find(key) is None:
+                    new[key] = i
+            keys = list(new)[-self.max_rows:]
+            if not keys:
+                return
+            rows = self._allocate(len(keys))
+            self.vectors[rows] = vectors[[new[key] for key in keys]]
+            self.keys[rows] = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(-1, KEY_BYTES)
+            self.ticks[rows] = self.tick
+            for key, row in zip(keys, rows):
+                self.rows[key] = row
+            self._write_meta()
+
+    def flush(self):
+        with self.lock:
+            if self.dim is not None:
+                with self.file_lock():
+                    self._refresh()
+                    for array in (self.vectors, self.keys, self.ticks):
+                        array.flush()
+                    self._write_meta()
+
+    @contextmanager
+    def file_lock(self, shared: bool = False):
+        """
+        Hold the cache directory's lock file, exclusively to write or shared to read, so that
+        processes writing wait for each other and for any process reading
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file("lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _allocate(self, count: int) -> np.ndarray:
+        """
+        Return count rows to write to: fresh rows while under the size cap, then least recently used ones
+        """
+        fresh = max(0, min(count, self.max_rows - self.size))
+        if self.size + fresh > self.capacity:
+            self._map(min(max(self.capacity * 2, self.size + fresh, INITIAL_ROWS), self.max_rows))
+        rows = np.arange(self.size, self.size + fresh)
+        self.ticks[rows] = self.tick
+        self.size += fresh
+        evict = count - fresh
+        if evict:
+            victims = np.argpartition(self.ticks[:self.size], evict - 1)[:evict]
+            for victim in victims:
+                self.rows.pop(self.keys[victim].tobytes(), None)
+            rows = np.concatenate([rows, victims])
+        return rows
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _map(self, capacity: int):
+        """
+        Memory-map the arrays with room for capacity rows, extending the files if needed
+        """
+        layout = [("vectors.f32", np.float32, self.dim), ("keys.u8", np.uint8, KEY_BYTES), ("ticks.i64", np.int64, None)]
+        for name, dtype, width in layout:
+            path = self._file(name)
+            size = capacity * np.dtype(dtype).itemsize * (width or 1)
+            if not os.path.exists(path) or os.path.getsize(path) < size:
+                with open(path, "ab") as f:
+                    f.truncate(size)
+        self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.keys = np.memmap(self._file("keys.u8"), dtype=np.uint8, mode="r+", shape=(capacity, KEY_BYTES))
+        self.ticks = np.memmap(self._file("ticks.i64"), dtype=np.int64, mode="r+", shape=(capacity,))
+        self.capacity = capacity
+
+    def _create(self, dim: int):
+        self.dim = dim
+        self._map(INITIAL_ROWS)
+
+    def _refresh(self):
+        """
+        Catch up with meta.json if it has been rewritten, by another process, since this one last read or wrote it
+        """
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return
+        if (stat.st_ino, stat.st_mtime_ns) != self.meta_version:
+            self._load()
+
+    def _load(self):
+        """
+        Catch up with meta.json, as last written by this or another process: map any added
+        capacity and index any added rows
+        """
+        with open(self.meta_path) as f:
+            stat = os.fstat(f.fileno())
+            meta = json.load(f)
+        self.meta_version = (stat.st_ino, stat.st_mtime_ns)
+        if meta["model"] != self.model_name:
+            raise ValueError(f"Embedding cache at {self.path} holds vectors of {meta['model']}, not {self.model_name}")
+        self.dim = meta["dim"]
+        self.tick = max(self.tick, meta["tick"])
+        if meta["capacity"] > self.capacity:
+            self._map(meta["capacity"])
+        if meta["size"] > self.size:
+            keys = self.keys[self.size:meta["size"]].tobytes()
+            for row, i in enumerate(range(0, len(keys), KEY_BYTES), start=self.size):
+                self.rows[keys[i:i + KEY_BYTES]] = row
+            self.size = meta["size"]
+
+    def _write_meta(self):
+        meta = {"model": self.model_name, "dim": self.dim, "size": self.size, "capacity": self.capacity, "tick": self.tick}
+        temp_path = f"{self.meta_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, self.meta_path)
+        stat = os.stat(self.meta_path)
+        self.meta_version = (stat.st_ino, stat.st_mtime_ns)
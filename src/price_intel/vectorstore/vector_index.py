@@ -0,0 +1,555 @@
+"""
+vector_index.py
+Nearest-neighbour lookup of similar products, behind one interface with two backends:
+
+- ChromaIndex queries the Chroma collection, as the agents always have
+- MatrixIndex searches an in-process copy of the collection: a memory-mapped float32 matrix of
+  normalized vectors, with parallel arrays of prices and of offsets into one documents file.
+  Search is exact, or over an inverted file (IVF) of k-means lists when the index has one
+- ShardedIndex holds one MatrixIndex per category, and searches only the shards of the hinted
+  categories, or all of them when there's no hint
+
+Rows are sorted by price, so a search restricted to a price band only scores a contiguous range.
+A MatrixIndex of every category keeps each row's category code, and masks out the rows of other
+categories when given a hint, so all three backends honour it.
+
+A MatrixIndex can also keep compact int8 or float16 copies of its vectors. Searching at that
+precision scans only the compact matrix for a short list of candidates, then re-ranks them
+exactly against the float32 rows, which are read from disk only for those candidates.
+Documents live out of line either way, and are only read for the final top k.
+
+MiniLM embeddings are normalized, so the inner product ranks neighbours as Chroma's L2 does.
+Build a MatrixIndex from the vectorstore with build_index.py.
+"""
+
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import chromadb
+import numpy as np
+from tqdm import tqdm
+
+INDEX_PATH = "products_index"
+PAGE_SIZE = 10_000  # Rows read from Chroma at a time while building
+BLOCK_ROWS = 65_536  # Rows scored at a time by an exact search
+NPROBE = 16  # IVF lists searched per query
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+RERANK = 50  # Candidates re-ranked at full precision per query when searching compact vectors
+PRECISIONS = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# The documents and prices of a query's neighbours, nearest first
+Neighbours = Tuple[List[str], List[float]]
+
+# The lowest and highest price of the neighbours to search for
+PriceBand = Tuple[float, float]
+
+
+def normalized(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def stacked(found: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stack the rows and scores found for each query into two matrices
+    """
+    return np.stack([rows for rows, _ in found]), np.stack([scores for _, scores in found])
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the columns of the k highest scores in each row, highest first
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(best, order, axis=1)
+
+
+class VectorIndex:
+    """
+    An abstract superclass for indexes of product embeddings
+    """
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        k: int = 5,
+        categories: Optional[Sequence[str]] = None,
+        price_band: Optional[PriceBand] = None,
+    ) -> List[Neighbours]:
+        """
+        Return the documents and prices of the k nearest products to each of these query vectors,
+        searching only the given categories and price band if there are any
+        """
+        raise NotImplementedError
+
+
+class ChromaIndex(VectorIndex):
+
+    def __init__(self, collection):
+        """
+        :param collection: a Chroma collection containing product documents & metadata
+        """
+        self.collection = collection
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        k: int = 5,
+        categories: Optional[Sequence[str]] = None,
+        price_band: Optional[PriceBand] = None,
+    ) -> List[Neighbours]:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, np.shape(vectors)[-1])
+        filters = []
+        if categories:
+            filters.append({"category": {"$in": list(categories)}})
+        if price_band is not None:
+            filters += [{"price": {"$gte": price_band[0]}}, {"price": {"$lte": price_band[1]}}]
+        where = {"$and": filters} if len(filters) > 1 else (filters[0] if filters else None)
+        results = self.collection.query(query_embeddings=vectors, n_results=k, where=where, include=["documents", "metadatas"])
+        return [
+            (documents, [m["price"] for m in metadatas])
+            for documents, metadatas in zip(results["documents"], results["metadatas"])
+        ]
+
+
+class MatrixIndex(VectorIndex):
+
+    def __init__(
+        self,
+        path: str = INDEX_PATH,
+        nprobe: int = NPROBE,
+        exact: bool = False,
+        precision: Optional[str] = None,
+        rerank: int = RERANK,
+    ):
+        """
+        :param path: the directory the index was built in
+        :param nprobe: how many IVF lists to search per query
+        :param exact: whether to score every vector even if the index has IVF lists
+        :param precision: the vectors to search: float32, or a compact copy the index was built with,
+            defaulting to the first compact copy if there is one
+        :param rerank: how many candidates to re-rank at full precision when searching a compact copy
+        """
+        self.path = path
+        self.nprobe = nprobe
+        self.rerank = rerank
+        with open(self._file("meta.json")) as f:
+            meta = json.load(f)
+        self.count = meta["count"]
+        self.dim = meta["dim"]
+        self.category = meta.get("category")
+        self.category_names = meta.get("categories")
+        quantized = meta.get("quantized", [])
+        self.precision = precision or (quantized[0] if quantized else "float32")
+        if self.precision != "float32" and self.precision not in quantized:
+            raise ValueError(f"Index at {path} has no {self.precision} vectors; it was built with {quantized or 'none'}")
+        self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        self.compact = self.vectors
+        self.scales = None
+        if self.precision != "float32":
+            dtype = PRECISIONS[self.precision]
+            self.compact = np.memmap(self._file(f"vectors.{self.precision}"), dtype=dtype, mode="r", shape=(self.count, self.dim))
+            if self.precision == "int8":
+                self.scales = np.fromfile(self._file("scales.f32"), dtype=np.float32)
+        self.prices = np.memmap(self._file("prices.f64"), dtype=np.float64, mode="r", shape=(self.count,))
+        self.codes = None
+        if self.category_names is not None:
+            self.codes = np.memmap(self._file("categories.u8"), dtype=np.uint8, mode="r", shape=(self.count,))
+        self.offsets = np.memmap(self._file("doc_offsets.i64"), dtype=np.int64, mode="r", shape=(self.count + 1,))
+        self.documents = np.memmap(self._file("documents.bin"), dtype=np.uint8, mode="r") if self.offsets[-1] else None
+        self.centroids = None
+        self.probed_rows = 0
+        if meta["nlist"] and not exact:
+            nlist = meta["nlist"]
+            self.centroids = np.fromfile(self._file("ivf_centroids.f32"), dtype=np.float32).reshape(nlist, self.dim)
+            self.list_rows = np.memmap(self._file("ivf_rows.i64"), dtype=np.int64, mode="r", shape=(self.count,))
+            self.list_offsets = np.fromfile(self._file("ivf_offsets.i64"), dtype=np.int64)
+            self.probed_rows = min(self.nprobe, nlist) * self.count // nlist  # Rows the IVF scores per query, on average
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def document(self, row: int) -> str:
+        return bytes(self.documents[self.offsets[row] : self.offsets[row + 1]]).decode()
+
+    def neighbours(self, rows: np.ndarray) -> Neighbours:
+        return [self.document(row) for row in rows], [float(self.prices[row]) for row in rows]
+
+    def row_range(self, price_band: Optional[PriceBand]) -> Tuple[int, int]:
+        """
+        Rows are sorted by price, so the rows priced within a band are one contiguous range
+        """
+        if price_band is None:
+            return 0, self.count
+        low, high = price_band
+        return int(np.searchsorted(self.prices, low, "left")), int(np.searchsorted(self.prices, high, "right"))
+
+    def category_mask(self, categories: Sequence[str]) -> np.ndarray:
+        """
+        Return which rows are in one of these categories, from each row's category code
+        """
+        if self.codes is None:
+            raise ValueError(f"Index at {self.path} has no category codes to filter by; rebuild it with build_index.py")
+        wanted = [code for code, name in enumerate(self.category_names) if name in categories]
+        return np.isin(self.codes, wanted)
+
+    def scores(self, queries: np.ndarray, rows) -> np.ndarray:
+        """
+        Score these rows of the searched vectors against each query.
+        int8 codes are scored against the query scaled by each dimension's quantization step
+        """
+        block = self.compact[rows]
+        if self.scales is not None:
+            queries = queries * self.scales
+        if block.dtype != np.float32:
+            block = block.astype(np.float32)
+        return queries @ block.T
+
+    def nearest(
+        self,
+        queries: np.ndarray,
+        k: int,
+        price_band: Optional[PriceBand] = None,
+        mask: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the rows of the k nearest vectors to each normalized query, nearest first, and their scores.
+        Searching compact vectors finds rerank candidates first, then re-ranks them at full precision.
+        A price band of at most one block of rows, or no more than the IVF would probe anyway, is
+        scanned exactly instead: the in-band rows of the probed lists would be only a handful of
+        arbitrary rows, and scoring the whole band costs about one block.
+        Rows outside the mask, if there is one, score -inf, so fewer than k may be found
+        """
+        start, stop = self.row_range(price_band)
+        depth = k if self.compact is self.vectors else max(k, self.rerank)
+        exact_limit = max(self.probed_rows, BLOCK_ROWS if price_band is not None else 0)
+        if self.centroids is None or stop - start <= exact_limit:
+            rows, scores = self.exact_rows(queries, depth, start, stop, mask)
+        else:
+            rows, scores = stacked([self.ivf_rows(query, depth, start, stop, mask) for query in queries])
+        if depth == k:
+            return rows, scores
+        return stacked([self.reranked(query, candidates, k, mask) for query, candidates in zip(queries, rows)])
+
+    def reranked(self, query: np.ndarray, candidates: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        candidates = np.sort(candidates)  # Read the memory-mapped rows in file order
+        scores = self.vectors[candidates] @ query
+        if mask is not None:
+            scores[~mask[candidates]] = -np.inf
+        best = top_k(scores[None, :], k)[0]
+        return candidates[best], scores[best]
+
+    def exact_rows(
+        self,
+        queries: np.ndarray,
+        k: int,
+        start: int,
+        stop: int,
+        mask: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every vector in rows [start, stop), a block at a time, keeping the best k rows per query so far
+        """
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for block in range(start, stop, BLOCK_ROWS):
+            end = min(block + BLOCK_ROWS, stop)
+            scores = self.scores(queries, slice(block, end))
+            if mask is not None:
+                scores[:, ~mask[block:end]] = -np.inf
+            rows = top_k(scores, k)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, rows, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, rows + block], axis=1)
+            keep = top_k(best_scores, k)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        return best_rows, best_scores
+
+    def ivf_rows(
+        self,
+        query: np.ndarray,
+        k: int,
+        start: int,
+        stop: int,
+        mask: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score only the vectors in rows [start, stop) of the nprobe lists whose centroids are nearest the query,
+        and in the mask if there is one
+        """
+        probes = top_k((self.centroids @ query)[None, :], self.nprobe)[0]
+        candidates = np.concatenate([self.list_rows[self.list_offsets[p] : self.list_offsets[p + 1]] for p in probes])
+        candidates = candidates[(candidates >= start) & (candidates < stop)]
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        if len(candidates) < min(k, stop - start):
+            rows, scores = self.exact_rows(query[None, :], k, start, stop, mask)
+            return rows[0], scores[0]
+        candidates.sort()  # Read the memory-mapped rows in file order
+        scores = self.scores(query[None, :], candidates)[0]
+        best = top_k(scores[None, :], k)[0]
+        return candidates[best], scores[best]
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        k: int = 5,
+        categories: Optional[Sequence[str]] = None,
+        price_band: Optional[PriceBand] = None,
+    ) -> List[Neighbours]:
+        """
+        A shard skips the search if it isn't one of the hinted categories; an index of every category
+        searches only the rows of the hinted categories
+        """
+        queries = normalized(vectors)
+        if categories and self.category is not None and self.category not in categories:
+            return [([], []) for _ in queries]
+        mask = self.category_mask(categories) if categories and self.category is None else None
+        rows, scores = self.nearest(queries, k, price_band, mask)
+        return [self.neighbours(found[found_scores > -np.inf]) for found, found_scores in zip(rows, scores)]
+
+
+class ShardedIndex(VectorIndex):
+
+    def __init__(self, path: str = INDEX_PATH, **options):
+        """
+        :param path: the directory the shards were built in, one MatrixIndex per category
+        :param options: how to search each shard, as for MatrixIndex
+        """
+        self.path = path
+        with open(os.path.join(path, "shards.json")) as f:
+            categories = json.load(f)["categories"]
+        self.shards = {category: MatrixIndex(os.path.join(path, category), **options) for category in categories}
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        k: int = 5,
+        categories: Optional[Sequence[str]] = None,
+        price_band: Optional[PriceBand] = None,
+    ) -> List[Neighbours]:
+        """
+        Search the shards of the hinted categories, or every shard if there's no hint for a shard
+        that exists, and merge their neighbours by score
+        """
+        queries = normalized(vectors)
+        names = [category for category in categories or [] if category in self.shards] or list(self.shards)
+        found = [(name, *self.shards[name].nearest(queries, k, price_band)) for name in names]
+        results = []
+        for i in range(len(queries)):
+            candidates = [(self.shards[name], row) for name, rows, _ in found for row in rows[i]]
+            scores = np.concatenate([scores[i] for _, _, scores in found])
+            best = top_k(scores[None, :], k)[0]
+            documents = [candidates[j][0].document(candidates[j][1]) for j in best]
+            prices = [float(candidates[j][0].prices[candidates[j][1]]) for j in best]
+            results.append((documents, prices))
+        return results
+
+
+def kmeans(vectors: np.ndarray, nlist: int, seed: int = 42) -> np.ndarray:
+    """
+    Spherical k-means over a sample of these normalized vectors; return nlist normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = np.bincount(assignment, minlength=nlist) == 0
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = normalized(sums)
+    return centroids
+
+
+def build_ivf(path: str, vectors: np.ndarray, nlist: int):
+    """
+    Cluster the vectors into nlist lists and write the centroids and each list's rows
+    """
+    centroids = kmeans(vectors, nlist)
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        assignment[start : start + BLOCK_ROWS] = np.argmax(vectors[start : start + BLOCK_ROWS] @ centroids.T, axis=1)
+    rows = np.argsort(assignment, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))])
+    centroids.tofile(os.path.join(path, "ivf_centroids.f32"))
+    rows.astype(np.int64).tofile(os.path.join(path, "ivf_rows.i64"))
+    offsets.astype(np.int64).tofile(os.path.join(path, "ivf_offsets.i64"))
+
+
+def quantize(path: str, vectors: np.ndarray, precision: str):
+    """
+    Write a compact copy of the vectors. int8 codes use a symmetric step per dimension,
+    sized to that dimension's largest magnitude
+    """
+    dtype = PRECISIONS[precision]
+    compact = np.memmap(os.path.join(path, f"vectors.{precision}"), dtype=dtype, mode="w+", shape=vectors.shape)
+    scales = None
+    if precision == "int8":
+        peaks = np.zeros(vectors.shape[1], dtype=np.float32)
+        for start in range(0, len(vectors), BLOCK_ROWS):
+            np.maximum(peaks, np.abs(vectors[start : start + BLOCK_ROWS]).max(axis=0), out=peaks)
+        scales = np.maximum(peaks, 1e-12) / 127
+        scales.tofile(os.path.join(path, "scales.f32"))
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        block = vectors[start : start + BLOCK_ROWS]
+        if scales is not None:
+            block = np.clip(np.rint(block / scales), -127, 127)
+        compact[start : start + BLOCK_ROWS] = block.astype(dtype)
+    compact.flush()
+
+
+def build_matrix_index(
+    collection,
+    path: str = INDEX_PATH,
+    nlist: Optional[int] = None,
+    quantized: Sequence[str] = (),
+    page_size: int = PAGE_SIZE,
+    category: Optional[str] = None,
+):
+    """
+    Copy a Chroma collection, or just one category of it, into a MatrixIndex at this path,
+    reading it a page at a time, then sort the rows by price.
+    With nlist, also build an IVF of that many lists; 0 builds an exact-only index, and None picks
+    about the square root of the row count. Each of the quantized precisions, int8 or float16,
+    adds a compact copy of the vectors to search.
+    The index is written to a temporary directory and swapped in once complete
+    """
+    unknown = set(quantized) - set(PRECISIONS) - {"float32"}
+    if unknown or "float32" in quantized:
+        raise ValueError(f"Can't quantize to {sorted(unknown) or 'float32'}; choose from int8 and float16")
+    start = time.perf_counter()
+    where = {"category": category} if category else None
+    count = collection.count() if where is None else len(collection.get(where=where, include=[])["ids"])
+    if count == 0:
+        raise ValueError("Can't build an index from an empty collection")
+    nlist = min(int(np.sqrt(count)) if nlist is None else nlist, count)
+    temp_path = f"{path}.tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    unsorted = None
+    prices = np.empty(count, dtype=np.float64)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    codes = np.zeros(count, dtype=np.uint8) if category is None else None
+    names = {}
+    with open(os.path.join(temp_path, "documents.unsorted"), "wb") as documents:
+        for offset in tqdm(range(0, count, page_size), desc=f"Copying {category or 'all'} vectors"):
+            result = collection.get(where=where, include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+            page = normalized(result["embeddings"])
+            if unsorted is None:
+                unsorted = np.memmap(os.path.join(temp_path, "vectors.unsorted"), dtype=np.float32, mode="w+", shape=(count, page.shape[1]))
+            rows = slice(offset, offset + len(page))
+            unsorted[rows] = page
+            prices[rows] = [m["price"] for m in result["metadatas"]]
+            if codes is not None:
+                codes[rows] = [names.setdefault(m.get("category") or "", len(names)) for m in result["metadatas"]]
+            encoded = [document.encode() for document in result["documents"]]
+            documents.write(b"".join(encoded))
+            offsets[offset + 1 : offset + 1 + len(page)] = offsets[offset] + np.cumsum([len(e) for e in encoded])
+    unsorted.flush()
+
+    vectors = sort_by_price(temp_path, unsorted, prices, offsets, codes)
+    if nlist:
+        build_ivf(temp_path, vectors, nlist)
+    for precision in quantized:
+        quantize(temp_path, vectors, precision)
+    with open(os.path.join(temp_path, "meta.json"), "w") as f:
+        meta = {"count": count, "dim": vectors.shape[1], "nlist": nlist, "quantized": list(quantized), "category": category}
+        if codes is not None:
+            meta["categories"] = list(names)
+        json.dump(meta, f)
+
+    del vectors, unsorted
+    for name in ("vectors.unsorted", "documents.unsorted"):
+        os.remove(os.path.join(temp_path, name))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temp_path, path)
+    compact = f", {' and '.join(quantized)} copies" if quantized else ""
+    print(f"✓ Built index of {count:,} {category + ' ' if category else ''}vectors ({nlist} IVF lists{compact}) at {path} in {time.perf_counter() - start:.1f}s")
+
+
+def sort_by_price(
+    path: str,
+    unsorted: np.ndarray,
+    prices: np.ndarray,
+    offsets: np.ndarray,
+    codes: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Write the vectors, prices, documents and any category codes copied from Chroma in order of price,
+    a block of rows at a time, so that any price band is a contiguous range of rows. Return the sorted vectors
+    """
+    order = np.argsort(prices, kind="stable")
+    prices[order].tofile(os.path.join(path, "prices.f64"))
+    if codes is not None:
+        codes[order].tofile(os.path.join(path, "categories.u8"))
+    vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="w+", shape=unsorted.shape)
+    lengths = np.diff(offsets)[order]
+    np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64).tofile(os.path.join(path, "doc_offsets.i64"))
+    documents = np.memmap(os.path.join(path, "documents.unsorted"), dtype=np.uint8, mode="r") if offsets[-1] else None
+    with open(os.path.join(path, "documents.bin"), "wb") as out:
+        for start in range(0, len(order), BLOCK_ROWS):
+            block = order[start : start + BLOCK_ROWS]
+            vectors[start : start + len(block)] = unsorted[block]
+            if documents is not None:
+                out.write(b"".join(bytes(documents[offsets[row] : offsets[row + 1]]) for row in block))
+    vectors.flush()
+    return vectors
+
+
+def build_shard(db_path: str, collection_name: str, path: str, category: str, nlist: Optional[int], quantized: Sequence[str]):
+    """
+    Worker entry point: build the shard of one category, through this process's own Chroma client
+    """
+    collection = chromadb.PersistentClient(path=db_path).get_collection(collection_name)
+    build_matrix_index(collection, os.path.join(path, category), nlist=nlist, quantized=quantized, category=category)
+
+
+def build_sharded_index(
+    db_path: str,
+    collection_name: str,
+    categories: Sequence[str],
+    path: str = INDEX_PATH,
+    nlist: Optional[int] = None,
+    quantized: Sequence[str] = (),
+    workers: int = 1,
+):
+    """
+    Build a ShardedIndex at this path: a MatrixIndex per category, workers of them at a time.
+    Categories with no rows in the collection get no shard
+    """
+    start = time.perf_counter()
+    collection = chromadb.PersistentClient(path=db_path).get_collection(collection_name)
+    present = [c for c in categories if collection.get(where={"category": c}, limit=1, include=[])["ids"]]
+    os.makedirs(path, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(build_shard, db_path, collection_name, path, c, nlist, quantized) for c in present]
+        for future in futures:
+            future.result()
+    with open(os.path.join(path, "shards.json"), "w") as f:
+        json.dump({"categories": present}, f)
+    print(f"✓ Built {len(present)} category shards at {path} in {time.perf_counter() - start:.1f}s")
+
+
+def open_index(path: str = INDEX_PATH, **options) -> VectorIndex:
+    """
+    Open the in-process index built at this path, sharded by category or not
+    """
+    if os.path.exists(os.path.join(path, "shards.json")):
+        return ShardedIndex(path, **options)
+    return MatrixIndex(path, **options)
@@ -0,0 +1,66 @@
+"""
+The array-based sampler must draw the same sample and split as the list-based code it replaced,
+so that the same seed keeps reproducing the same train and test sets.
+"""
+
+import random
+from collections import defaultdict
+
+import numpy as np
+
+from price_intel.data.items import Item
+from price_intel.data.sampling_and_split import balanced_sample, make_price_slots, split_train_test
+
+CATEGORIES = ["Automotive", "Electronics", "Office_Products", "Tools_and_Home_Improvement"]
+
+
+def make_items(count: int = 30_000, seed: int = 0):
+    """Synthetic Items, crowded into cheap price slots so that many slots are over SLOT_SIZE"""
+    rng = np.random.default_rng(seed)
+    prices = np.concatenate([rng.uniform(0.5, 20, count * 9 // 10), rng.uniform(20, 999.49, count - count * 9 // 10)])
+    categories = rng.choice(CATEGORIES, size=count, p=[0.4, 0.2, 0.2, 0.2])
+    return [
+        Item.from_fields(f"item {i}", float(price), str(category), None, 0)
+        for i, (price, category) in enumerate(zip(rng.permutation(prices), categories))
+    ]
+
+
+def legacy_sample_and_split(items, train_size, test_size):
+    """The list-based balanced_sample and split_train_test, as they were before sampling moved to arrays"""
+    slots = defaultdict(list)
+    for item in items:
+        slots[round(item.price)].append(item)
+    np.random.seed(42)
+    random.seed(42)
+    sample = []
+    for i in range(1, 1000):
+        slot = slots[i]
+        if i >= 240 or len(slot) <= 1200:
+            sample.extend(slot)
+        else:
+            weights = np.array([1 if item.category == "Automotive" else 5 for item in slot])
+            weights = weights / np.sum(weights)
+            selected_indices = np.random.choice(len(slot), size=1200, replace=False, p=weights)
+            sample.extend(slot[idx] for idx in selected_indices)
+    random.seed(42)
+    random.shuffle(sample)
+    return sample[:train_size], sample[train_size:train_size + test_size]
+
+
+def test_split_matches_legacy_sampler():
+    items = make_items()
+    row_of = {id(item): row for row, item in enumerate(items)}
+    legacy_train, legacy_test = legacy_sample_and_split(items, train_size=8_000, test_size=500)
+
+    sample = balanced_sample(make_price_slots(items))
+    train, test = split_train_test(sample, train_size=8_000, test_size=500)
+
+    assert [int(row) for row in train] == [row_of[id(item)] for item in legacy_train]
+    assert [int(row) for row in test] == [row_of[id(item)] for item in legacy_test]
+
+
+def test_split_is_reproducible():
+    slots = make_price_slots(make_items(seed=1))
+    first = split_train_test(balanced_sample(slots), train_size=5_000, test_size=200)
+    second = split_train_test(balanced_sample(slots), train_size=5_000, test_size=200)
+    assert [list(map(int, rows)) for rows in first] == [list(map(int, rows)) for rows in second]